@@ -19,9 +19,73 @@ def init():
     parser.add_argument('-r', '--resolution', nargs=2, type=int, default=(defaults["resolution"][0], defaults["resolution"][1]), help='Set the resolution of the window')
     parser.add_argument('-o', '--overlay', action="store_true", default=defaults["show_overlay"], help='Enable the stats overlay')
     parser.add_argument('-rm', '--render-mode', type=str, default=defaults["render_mode"], help='Set the render mode (wireframe, solid, points)')
-    parser.add_argument('-fps', '--fps', type=int, default=defaults["fps"], help='Set the target FPS')
+    parser.add_argument('-pd', '--particle-draw', type=str, default=defaults["particle_draw"], help='Set how particles are drawn (splat, circles)')
+    parser.add_argument('-lp', '--lod-particles', type=int, default=defaults["lod_particles"], help='Set the particle count from which their density image is drawn instead of the particles (0 disables)')
+    parser.add_argument('-lft', '--lod-frame-time', type=float, default=defaults["lod_frame_time"], help='Set the frame time in ms above which the density image is drawn instead of the particles (0 disables)')
+    parser.add_argument('-lbs', '--lod-bin-size', type=int, default=defaults["lod_bin_size"], help='Set the size in pixels of the bins of the density image')
+    parser.add_argument('-rth', '--render-threads', type=int, default=defaults["render_threads"], help='Set the number of threads rasterizing screen tiles concurrently (1 renders the frame in one pass)')
+    parser.add_argument('-rts', '--render-tile-size', type=int, default=defaults["render_tile_size"], help='Set the width and height in pixels of the screen tiles rasterized by the render threads')
+    parser.add_argument('-fps', '--fps', type=int, default=defaults["fps"], help='Set the target FPS the frames are paced to (0 runs unpaced)')
+    parser.add_argument('-aq', '--adaptive-quality', action="store_true", default=defaults["adaptive_quality"], help='Lower the render resolution, particle size, LOD threshold and simulation substeps when frames run over the FPS budget')
+    parser.add_argument('-sub', '--substeps', type=int, default=defaults["substeps"], help='Set the number of simulation steps per frame at full quality')
+    parser.add_argument('-nm', '--neighbor-mode', type=str, default=defaults["neighbor_mode"], help='Set the particle neighbor search (all_pairs, grid, tiled, verlet)')
+    parser.add_argument('-c', '--cutoff', type=float, default=defaults["cutoff"], help='Set the interaction cutoff used by the grid and verlet neighbor searches')
+    parser.add_argument('-sk', '--skin', type=float, default=defaults["skin"], help='Set the margin added to the cutoff by the verlet neighbor search')
+    parser.add_argument('-ts', '--tile-size', type=int, default=defaults["tile_size"], help='Set the number of rows evaluated at once by the tiled neighbor search')
+    parser.add_argument('-be', '--backend', type=str, default=defaults["backend"], help='Set the compute backend running the fluid step (numpy, numba if installed), replacing the neighbor search')
+    parser.add_argument('-cb', '--check-backend', action="store_true", default=False, help='Check that the selected backend agrees with the numpy reference and exit')
+    parser.add_argument('-w', '--workers', type=int, default=defaults["workers"], help='Set the number of worker processes computing particle interactions (1 runs them in the main process)')
+    parser.add_argument('-ss', '--sleep-steps', type=int, default=defaults["sleep_steps"], help='Set the number of calm steps after which a particle falls asleep (0 disables sleeping)')
+    parser.add_argument('-b', '--batched', action="store_true", default=defaults["batched"], help='Pack all the fluids into one particle array and step them together')
+    parser.add_argument('-x', '--cross-interaction', action="store_true", default=defaults["cross_interaction"], help='Let particles of different fluids interact (batched mode)')
+    parser.add_argument('-f32', '--float32', action="store_true", default=defaults["float32"], help='Store the particles in single precision')
+    parser.add_argument('-th', '--threaded-sim', action="store_true", default=defaults["threaded_sim"], help='Run the simulation on its own thread')
+    parser.add_argument('-tr', '--tick-rate', type=float, default=defaults["tick_rate"], help='Set the simulation steps per second of the threaded simulation')
+    parser.add_argument('-rec', '--record', type=str, default=None, help='Run the simulation offline and record it into a trajectory file')
+    parser.add_argument('-rf', '--record-frames', type=int, default=defaults["record_frames"], help='Set the number of frames to record')
+    parser.add_argument('-rv', '--record-velocities', action="store_true", default=defaults["record_velocities"], help='Record the velocities along with the positions')
+    parser.add_argument('-rep', '--replay', type=str, default=None, help='Replay a recorded trajectory file instead of running the simulation')
+    parser.add_argument('-rnd', '--render-frames', type=str, default=None, help='Render the run offscreen into a directory of PNG frames, or a .npy raw frame stream, and exit')
+    parser.add_argument('-cam', '--camera-path', type=str, default=None, help='Set the JSON camera path followed when rendering frames')
+    parser.add_argument('-rw', '--render-workers', type=int, default=defaults["render_workers"], help='Set the number of processes rendering frames (0 uses every core)')
+    parser.add_argument('-sd', '--seed', type=int, default=defaults["seed"], help='Set the seed of the initial particle layout (random if not set)')
+    parser.add_argument('-rin', '--record-inputs', type=str, default=None, help='Record the inputs of every frame and the seed of the run into a file')
+    parser.add_argument('-pin', '--replay-inputs', type=str, default=None, help='Replay the inputs and the seed recorded in a file instead of the live inputs, then exit')
     parser.add_argument('-p', '--profile-run', action="store_true", default=defaults["profile_run"], help='Enable profiling mode')
 
     args = parser.parse_args()
+    checkCompatibility(parser, args)
 
     return args
+
+
+def checkCompatibility(parser, args):
+    """Exits with an error when two options would silently override one another
+
+    Parameters
+    ----------
+    parser : argparse.ArgumentParser
+        The parser, reporting the error
+    args : argparse.Namespace
+        The parsed command line arguments
+    """
+
+    # The worker pool runs the tiled all-pairs kernel, it has no grid or verlet version
+    if args.workers > 1 and args.neighbor_mode not in ("all_pairs", "tiled"):
+        parser.error(f"--workers computes all-pairs interactions, it cannot be used with --neighbor-mode {args.neighbor_mode}")
+
+    # Sleeping steps the awake particles with its own cell list of range --cutoff
+    if args.sleep_steps > 0 and (args.neighbor_mode != "grid" or args.workers > 1):
+        parser.error("--sleep-steps finds the interactions of awake particles with a cell list, it requires "
+                     "--neighbor-mode grid and cannot be used with --workers")
+
+    # Batched mode steps the packed fluids with one cell list, replacing the per-fluid step
+    if args.batched and (args.neighbor_mode != "grid" or args.workers > 1 or args.backend is not None
+                         or args.sleep_steps > 0):
+        parser.error("--batched steps the packed fluids with a cell list, it requires --neighbor-mode grid and cannot "
+                     "be used with --workers, --backend or --sleep-steps")
+
+    # A backend runs the whole all-pairs step itself
+    if args.backend is not None and (args.neighbor_mode != "all_pairs" or args.workers > 1 or args.sleep_steps > 0):
+        parser.error("--backend runs the whole all-pairs step, it cannot be used with another --neighbor-mode, "
+                     "--workers or --sleep-steps")
@@ -0,0 +1,205 @@
+import abc
+
+import numpy as np
+
+import simulation
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+# ----------------------------------------
+# Compute backends for the fluid step
+# ----------------------------------------
+
+BACKENDS = {}
+
+
+def registerBackend(name):
+    """Class decorator registering a backend under the given name
+
+    Parameters
+    ----------
+    name : str
+        The name the backend is selected with
+    """
+
+    def register(cls):
+        cls.name = name
+        BACKENDS[name] = cls
+        return cls
+
+    return register
+
+
+def getBackend(name):
+    """Returns a new instance of the backend registered under the given name
+
+    Parameters
+    ----------
+    name : str
+        The name of the backend
+
+    Returns
+    -------
+    backend : backends.Backend
+        The backend
+    """
+
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown backend: {name} (available: {', '.join(BACKENDS)})")
+
+    return BACKENDS[name]()
+
+
+class Backend(abc.ABC):
+    """A compute backend runs the step kernel of a fluid: the all-pairs particle interactions followed by the integration
+    (gravity, fountain, walls and damping), with the same physics as the reference NumPy backend.
+    """
+
+    name = None
+
+    @abc.abstractmethod
+    def step(self, fluid, dt, step_fraction=1.0):
+        """Updates the fluid in place
+
+        Parameters
+        ----------
+        fluid : simulation.Fluid
+            The fluid to update
+        dt : float
+            The time step
+        step_fraction : float
+            The fraction of the frame covered by the step, scaling the velocity changes and the damping
+        """
+
+
+@registerBackend("numpy")
+class NumpyBackend(Backend):
+    """The reference backend, running the fluid's own NumPy all-pairs kernel and integration"""
+
+    def step(self, fluid, dt, step_fraction=1.0):
+        fluid.applyAllPairsInteractions(step_fraction)
+        fluid.integrate(fluid.p_positions, fluid.p_velocities, dt, step_fraction)
+
+
+if numba is not None:
+
+    @numba.njit(parallel=True, cache=True)
+    def _numbaInteractions(positions, masses, velocities, step_fraction):
+        nb_particles = positions.shape[0]
+
+        for i in numba.prange(nb_particles):
+            acceleration_x = 0.0
+            acceleration_y = 0.0
+            acceleration_z = 0.0
+
+            for j in range(nb_particles):
+                vector_x = positions[i, 0] - positions[j, 0]
+                vector_y = positions[i, 1] - positions[j, 1]
+                vector_z = positions[i, 2] - positions[j, 2]
+
+                distance = np.sqrt(vector_x * vector_x + vector_y * vector_y + vector_z * vector_z)
+                if distance == 0:
+                    distance = 0.0001
+
+                multiplier = 1 / (3 + np.exp(10 * distance - 1.5)) / distance / masses[j]
+
+                acceleration_x += vector_x * multiplier
+                acceleration_y += vector_y * multiplier
+                acceleration_z += vector_z * multiplier
+
+            velocities[i, 0] += acceleration_x * step_fraction
+            velocities[i, 1] += acceleration_y * step_fraction
+            velocities[i, 2] += acceleration_z * step_fraction
+
+    @numba.njit(parallel=True, cache=True)
+    def _numbaIntegrate(positions, velocities, size, gravity, damping, dt, step_fraction):
+        center_x = size[0] / 2
+        center_z = size[2] / 2
+        radius = min(size[0], size[2]) / 5
+        step_damping = damping ** step_fraction
+
+        for i in numba.prange(positions.shape[0]):
+            # Gravity
+            velocities[i, 1] -= gravity * step_fraction
+
+            # Fountain
+            offset_x = positions[i, 0] - center_x
+            offset_z = positions[i, 2] - center_z
+            if offset_x * offset_x + offset_z * offset_z < radius * radius:
+                velocities[i, 1] += 0.2 * step_fraction
+
+            for axis in range(3):
+                pos_test = positions[i, axis] + velocities[i, axis] * dt
+
+                # Collision with the walls
+                if pos_test <= 0 or pos_test >= size[axis]:
+                    velocities[i, axis] *= -1 * (0.5)
+
+                positions[i, axis] = min(max(pos_test, 0), size[axis])
+
+                # Global damping
+                velocities[i, axis] *= step_damping
+
+    @registerBackend("numba")
+    class NumbaBackend(Backend):
+        """A JIT-compiled backend running the all-pairs kernel and the integration as multi-threaded loops, without any
+        N*N temporary. Only registered when numba is installed.
+        """
+
+        def step(self, fluid, dt, step_fraction=1.0):
+            _numbaInteractions(fluid.p_positions, fluid.p_masses, fluid.p_velocities, step_fraction)
+            _numbaIntegrate(fluid.p_positions, fluid.p_velocities, fluid.bounds, fluid.gravity, fluid.damping, dt,
+                            step_fraction)
+
+
+def checkEquivalence(name, reference="numpy", nb_particles=500, steps=10, seed=0, dt=0.01, rtol=1e-6, atol=1e-9):
+    """Runs a backend and the reference backend on the same seeded fluid and asserts that they agree
+
+    Parameters
+    ----------
+    name : str
+        The name of the backend to check
+    reference : str
+        The name of the backend it is checked against
+    nb_particles : int
+        The number of particles of the fluid
+    steps : int
+        The number of steps run by each backend
+    seed : int
+        The seed of the initial particle positions
+    dt : float
+        The time step
+    rtol : float
+        The relative tolerance
+    atol : float
+        The absolute tolerance
+
+    Raises
+    ------
+    AssertionError
+        If the positions or velocities of the two runs differ by more than the tolerance
+    """
+
+    rng = np.random.default_rng(seed)
+    size = [5, 10, 5]
+    initial_positions = rng.random((nb_particles, 3)) * size
+    masses = rng.uniform(0.5, 2, nb_particles)
+
+    fluids = []
+    for backend_name in (reference, name):
+        fluid = simulation.addFluid(0, [0, 0, 0], size)
+        fluid.particles = simulation.ParticleStore(initial_positions.copy(), np.zeros((nb_particles, 3)), masses.copy())
+        fluid.backend = getBackend(backend_name)
+
+        for i in range(steps):
+            fluid.update(dt)
+
+        fluids.append(fluid)
+
+    np.testing.assert_allclose(fluids[1].p_positions, fluids[0].p_positions, rtol=rtol, atol=atol,
+                               err_msg=f"{name} positions differ from {reference}")
+    np.testing.assert_allclose(fluids[1].p_velocities, fluids[0].p_velocities, rtol=rtol, atol=atol,
+                               err_msg=f"{name} velocities differ from {reference}")
@@ -0,0 +1,175 @@
+import numpy as np
+
+# ----------------------------------------
+# Frustum culling
+# ----------------------------------------
+
+
+def frustumPlanes(view_projection_matrix):
+    """Extracts the six planes of the camera frustum from the view-projection matrix. A point p is inside a plane
+    (a, b, c, d) when a p.x + b p.y + c p.z + d >= 0. The planes match the clip space used by the renderer:
+    -w <= x, y <= w and 0 <= z <= w.
+
+    Parameters
+    ----------
+    view_projection_matrix : numpy.ndarray
+        The 4x4 view-projection matrix
+
+    Returns
+    -------
+    numpy.ndarray
+        A (6, 4) array of planes (left, right, bottom, top, near, far)
+    """
+
+    rows = view_projection_matrix
+
+    planes = np.array([
+        rows[3] + rows[0],
+        rows[3] - rows[0],
+        rows[3] + rows[1],
+        rows[3] - rows[1],
+        rows[2],
+        rows[3] - rows[2],
+    ])
+
+    # Normalize the planes so that sphere radii can be compared to the distances
+    return planes / np.linalg.norm(planes[:, :3], axis=1)[:, np.newaxis]
+
+
+def boxInFrustum(planes, box_min, box_max):
+    """Tests an axis-aligned box against the frustum planes
+
+    Parameters
+    ----------
+    planes : numpy.ndarray
+        The (6, 4) frustum planes
+    box_min : numpy.ndarray
+        The lower corner of the box
+    box_max : numpy.ndarray
+        The upper corner of the box
+
+    Returns
+    -------
+    int
+        -1 if the box is outside of the frustum, 1 if it is entirely inside, 0 if it intersects its boundary
+    """
+
+    # For each plane, the corners of the box furthest along and against its normal
+    positive = planes[:, :3] >= 0
+    far_corners = np.where(positive, box_max, box_min)
+    near_corners = np.where(positive, box_min, box_max)
+
+    if ((far_corners * planes[:, :3]).sum(axis=1) + planes[:, 3] < 0).any():
+        return -1
+    if ((near_corners * planes[:, :3]).sum(axis=1) + planes[:, 3] >= 0).all():
+        return 1
+    return 0
+
+
+class BoundingVolumeHierarchy:
+    """A hierarchy of axis-aligned boxes over a list of objects, built top-down by splitting the objects at the median
+    of their centers along the longest axis. Each object must provide an aabb (its (2, 3) lower and upper corners) and a
+    bounding_sphere (its center and radius).
+
+    Parameters
+    ----------
+    objects : list
+        The objects
+    leaf_size : int
+        The maximum number of objects per leaf
+    """
+
+    def __init__(self, objects, leaf_size=4):
+        self.objects = list(objects)
+        self.leaf_size = leaf_size
+
+        # Flat arrays of nodes: box corners, children (-1 for leaves), and the range of self.order held by leaves
+        self.node_min = []
+        self.node_max = []
+        self.node_children = []
+        self.node_ranges = []
+
+        self.boxes = np.array([object.aabb for object in self.objects]).reshape(-1, 2, 3)
+        self.centers = np.array([object.bounding_sphere[0] for object in self.objects]).reshape(-1, 3)
+        self.radii = np.array([object.bounding_sphere[1] for object in self.objects])
+        self.order = np.arange(len(self.objects))
+
+        if self.objects:
+            self.buildNode(0, len(self.objects))
+
+        self.node_min = np.array(self.node_min)
+        self.node_max = np.array(self.node_max)
+
+    def buildNode(self, start, end):
+        """Builds the node holding order[start:end] and its descendants, returning its index"""
+
+        node = len(self.node_min)
+        boxes = self.boxes[self.order[start:end]]
+        self.node_min.append(boxes[:, 0].min(axis=0))
+        self.node_max.append(boxes[:, 1].max(axis=0))
+        self.node_children.append((-1, -1))
+        self.node_ranges.append((start, end))
+
+        if end - start > self.leaf_size:
+            # Split at the median of the centers along the longest axis of the node
+            centers = boxes.mean(axis=1)
+            axis = np.argmax(self.node_max[node] - self.node_min[node])
+            self.order[start:end] = self.order[start:end][np.argsort(centers[:, axis], kind="stable")]
+
+            middle = (start + end) // 2
+            left = self.buildNode(start, middle)
+            right = self.buildNode(middle, end)
+            self.node_children[node] = (left, right)
+
+        return node
+
+    def query(self, planes):
+        """Returns the objects overlapping the frustum. Subtrees entirely inside the frustum are accepted without
+        testing their objects, subtrees entirely outside are skipped, and the objects of the leaves crossing its
+        boundary are tested by bounding sphere, then by box.
+
+        Parameters
+        ----------
+        planes : numpy.ndarray
+            The (6, 4) frustum planes
+
+        Returns
+        -------
+        list
+            The visible objects, in their original order
+        """
+
+        if not self.objects:
+            return []
+
+        visible = []
+        stack = [0]
+        while stack:
+            node = stack.pop()
+            containment = boxInFrustum(planes, self.node_min[node], self.node_max[node])
+            if containment < 0:
+                continue
+
+            start, end = self.node_ranges[node]
+            if containment > 0:
+                visible.extend(self.order[start:end])
+                continue
+
+            left, right = self.node_children[node]
+            if left >= 0:
+                stack.append(left)
+                stack.append(right)
+                continue
+
+            # Leaf objects whose sphere and box both reach inside every plane
+            indices = self.order[start:end]
+            distances = self.centers[indices] @ planes[:, :3].T + planes[:, 3]
+            kept = (distances >= -self.radii[indices][:, np.newaxis]).all(axis=1)
+
+            far_corners = np.where(planes[:, :3] >= 0,
+                                   self.boxes[indices, 1][:, np.newaxis], self.boxes[indices, 0][:, np.newaxis])
+            kept &= ((far_corners * planes[:, :3]).sum(axis=2) + planes[:, 3] >= 0).all(axis=1)
+
+            visible.extend(indices[kept])
+
+        return [self.objects[index] for index in sorted(visible)]
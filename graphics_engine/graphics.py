@@ -3,9 +3,12 @@ import pygame
 import numpy as np
 
 import inputHandling as inputHandling
+import graphics_engine.raster as raster
+import graphics_engine.culling as culling
 import json
 import math
 import os
+import time
 
 # ----------------------------------------
 # Initialise the simulation
@@ -35,6 +38,7 @@ class Rendering:
         self.render_mode = args.render_mode
         self.show_overlay = args.overlay
         self.fps = args.fps
+        self.particle_draw = args.particle_draw
 
         self.camera = {
             "position": np.array([-3.42, 8.2, -5.96], dtype=float),
@@ -46,376 +50,853 @@ class Rendering:
 
         self.projection_matrix = self.getProjectionMatrix()
 
-    def draw(self, simulation):
+        # Cached view-projection matrix and the camera state it was built from
+        self.view_projection_matrix = None
+        self.view_projection_key = None
+
+        # Color and depth buffers the particles are splatted and the solids rasterized into
+        self.framebuffer = raster.FrameBuffer(self.resolution)
+
+        # Overlay font, background, rendered text lines and composed HUD, created once and updated when they change
+        self.overlay_font = None
+        self.overlay_background = None
+        self.overlay_lines = []
+        self.overlay_hud = None
+        self.overlay_timing_lines = None
+        self.overlay_timing_time = 0
+
+        # Ring buffers of the stage durations shown on the overlay, set by the main loop
+        self.frame_timer = None
+
+        # Bounding volume hierarchy over the gameObjects and the objects it was built from
+        self.bvh = None
+        self.bvh_key = None
+
+        # Quality knobs, lowered by the quality governor when frames run over budget: the fraction of the resolution
+        # rendered, the scale of the particles' size, and the scale of the particle count switching to the density image
+        self.render_scale = 1
+        self.particle_scale = 1
+        self.lod_scale = 1
+        self.scaled_surface = None
+        self.quality_governor = None
+
+        # Particle level of detail: every particle ("points") or their density image ("density")
+        self.particle_lod = "points"
+        self.lod_particles = args.lod_particles
+        self.lod_frame_time = args.lod_frame_time
+        self.lod_bin_size = args.lod_bin_size
+        self.lod_switch_count = 0
+        self.lod_reason = None
+        self.lod_slow_frames = 0
+        self.lod_fast_frames = 0
+        self.lod_retry_frames = 60
+        # Duration of the last frame, and whether it is representative of the particles' cost (frames rendering the
+        # static layer again are not)
+        self.draw_time = 0
+        self.draw_time_valid = False
+        self.static_redrawn = False
+
+        # Cached static geometry, the state it was rendered for, and the areas changed by the last frame
+        self.static_layer = raster.FrameBuffer(self.resolution)
+        self.static_key = None
+        self.static_version = 0
+        self.particles_region = None
+        self.overlay_shown = False
+        self.dirty_rects = None
+
+        # Tiles rasterized concurrently on a thread pool, when several render threads are requested
+        self.tile_renderer = None
+        if args.render_threads > 1:
+            self.tile_renderer = raster.TileRenderer(args.render_tile_size, args.render_threads)
+
+        # 12 colors
+        self.face_colors = np.array([
+            (255, 0, 0),
+            (255, 127, 0),
+            (255, 255, 0),
+            (127, 255, 0),
+            (0, 255, 0),
+            (0, 255, 127),
+            (0, 255, 255),
+            (0, 127, 255),
+            (0, 0, 255),
+            (127, 0, 255),
+            (255, 0, 255),
+            (255, 0, 127)
+        ], dtype=np.uint8)
+
+    def draw(self, simulation, positions=None, present=True):
         """Draws the simulation, overlay, and grid on the screen using the provided simulation class
 
         Parameters
         ----------
         simulation : Simulation
             The simulation to draw
+        positions : list
+            The particle positions to draw for each fluid, instead of the fluids' current positions
+        present : bool
+            Whether to present the frame on the display, False when drawing into an offscreen surface
         """
 
-        # Clear the screen
-        self.screen.fill(self.consts["color_bg"])
+        draw_start = time.perf_counter()
 
-        # Draw the points
-        self.drawWorld(simulation)
+        # Draw the points, into a smaller surface upscaled onto the screen when the render scale is lowered
+        if self.render_scale == 1:
+            self.drawWorld(simulation, positions)
+        else:
+            self.drawWorldScaled(simulation, positions)
         # Draw the overlay
         if (self.show_overlay):
             self.drawOverlay()
+        self.overlay_shown = self.show_overlay
 
-        # Apply changes to screen
-        pygame.display.flip()
+        # Apply changes to screen, only the changed rectangles when the static layer was reused
+        if present:
+            if self.dirty_rects is None:
+                pygame.display.flip()
+            else:
+                pygame.display.update(self.dirty_rects)
 
-    def drawWorld(self, simulation):
-        """Draws the world on the screen using the provided simulation class
+        self.draw_time = time.perf_counter() - draw_start
+        self.draw_time_valid = not self.static_redrawn
+
+    def drawWorldScaled(self, simulation, positions=None):
+        """Draws the world at render_scale times the window resolution into an offscreen surface, then upscales it onto
+        the screen
 
         Parameters
         ----------
         simulation : Simulation
             The simulation to draw
+        positions : list
+            The particle positions to draw for each fluid, instead of the fluids' current positions
         """
 
-        # Math out this frame's camera rotation matrix
-        camera_rotation_matrix = self.getCameraRotationMatrix()
+        screen = self.screen
+        resolution = self.resolution
+        size = (max(1, int(resolution[0] * self.render_scale)), max(1, int(resolution[1] * self.render_scale)))
+
+        if self.scaled_surface is None or self.scaled_surface.get_size() != size:
+            self.scaled_surface = pygame.Surface(size)
 
-        self.renderGameObjects(simulation, camera_rotation_matrix)
-        self.renderFluids(simulation, camera_rotation_matrix)
+        # Everything drawn by drawWorld follows self.screen and self.resolution
+        self.screen = self.scaled_surface
+        self.resolution = size
+        try:
+            self.drawWorld(simulation, positions)
+        finally:
+            self.screen = screen
+            self.resolution = resolution
 
-    def renderFluids(self, simulation, camera_rotation_matrix):
-        """Renders the fluids on the screen using the provided simulation class
+        pygame.transform.scale(self.scaled_surface, screen.get_size(), screen)
+        self.dirty_rects = None
+
+    def drawWorld(self, simulation, positions=None):
+        """Draws the world on the screen using the provided simulation class. The static geometry is cached in a layer
+        that is only rendered again when the camera, the window or the scene changes. Each frame, the areas covered by
+        the particles (this frame and the last) and by the overlay are restored from it, the particles are drawn on top,
+        and only these areas are blitted and listed in dirty_rects for presentation.
 
         Parameters
         ----------
         simulation : Simulation
             The simulation to draw
-        camera_rotation_matrix : numpy.ndarray
-            The rotation matrix of the camera
+        positions : list
+            The particle positions to draw for each fluid, instead of the fluids' current positions
         """
 
-        for fluid in simulation.fluids:
-            for p_position in fluid.p_positions:
-                point_2D = self.vec3tovec2(p_position, camera_rotation_matrix)
-                color = self.consts["color_fluid"]
+        if positions is None:
+            positions = [fluid.p_positions for fluid in simulation.fluids]
+
+        if self.framebuffer.resolution != tuple(self.resolution):
+            self.framebuffer.resize(self.resolution)
+            self.static_layer.resize(self.resolution)
+
+        # Render the static layer again if anything it depends on changed
+        static_key = self.getStaticKey(simulation)
+        redraw_all = static_key != self.static_key
+        self.static_redrawn = redraw_all
+        if redraw_all:
+            self.renderStaticLayer(simulation)
+            self.static_key = static_key
+
+        self.selectParticleLod(sum(len(p_positions) for p_positions in positions))
+
+        projected = self.projectFluids(positions)
+        particles_region = self.getParticlesRegion(projected)
+
+        if redraw_all:
+            regions = [(0, 0, *self.framebuffer.resolution)]
+        else:
+            regions = [region for region in (raster.unionRegion(particles_region, self.particles_region), self.getOverlayRegion())
+                       if region is not None]
+        self.particles_region = particles_region
+
+        # Restore the regions from the static layer and draw the particles on top
+        if self.tile_renderer is not None and self.particle_lod != "density":
+            if self.particle_draw == "splat":
+                for points_2D, depths, radii in projected:
+                    self.tile_renderer.addPoints(points_2D, depths, radii, self.consts["color_fluid"])
+            self.tile_renderer.render(self.framebuffer, background=self.static_layer, regions=regions)
+        else:
+            for region in regions:
+                self.framebuffer.copyFrom(self.static_layer, region)
+                if self.particle_lod == "density":
+                    raster.splatDensity(self.framebuffer, np.concatenate([points_2D for points_2D, _, _ in projected]),
+                                        self.lod_bin_size, self.consts["color_fluid"], region)
+                elif self.particle_draw == "splat":
+                    self.splatFluids(projected, region)
+
+        for region in regions:
+            self.framebuffer.blit(self.screen, region)
+
+        if self.particle_lod != "density" and self.particle_draw == "circles":
+            self.renderFluids(projected)
+
+        self.dirty_rects = None if redraw_all else [pygame.Rect(x0, y0, x1 - x0, y1 - y0) for x0, y0, x1, y1 in regions]
+
+    def selectParticleLod(self, nb_particles):
+        """Switches between drawing every particle and drawing their density image.
+
+        Density mode is entered once the particle count reaches lod_particles, and left once the count falls below 80%
+        of it. It is also entered once 3 frames in a row drawn with points took longer than lod_frame_time, and left
+        once the density frames have run under half of lod_frame_time for lod_retry_frames frames; each retry that
+        turns out slow again doubles the wait before the next one. Frames that rendered the static layer again are not
+        counted.
 
-                if point_2D == (-1, -1):
-                    continue
+        Parameters
+        ----------
+        nb_particles : int
+            The number of particles to draw
+        """
 
-                # Draw the point
-                pygame.draw.circle(self.screen, color, point_2D, 3)
-        
-        for fluid in simulation.fluids:
-            # Draw the bounding box
-            if (self.render_mode == "points"):
-                self.draw_object_as_points(fluid.bounds_object, camera_rotation_matrix)
-            elif (self.render_mode == "wireframe"):
-                self.draw_object_as_wires(fluid.bounds_object, camera_rotation_matrix)
-            elif (self.render_mode == "solid"):
-                self.draw_object_as_solids(fluid.bounds_object, camera_rotation_matrix)
+        frame_time = self.draw_time * 1000 if self.draw_time_valid else None
+
+        if self.particle_lod == "density":
+            if self.lod_reason == "count":
+                if nb_particles < 0.8 * self.lod_switch_count:
+                    self.particle_lod = "points"
+            elif frame_time is not None:
+                self.lod_fast_frames = self.lod_fast_frames + 1 if frame_time < 0.5 * self.lod_frame_time else 0
+                if self.lod_fast_frames >= self.lod_retry_frames:
+                    self.particle_lod = "points"
+                    self.lod_slow_frames = 0
+                    self.lod_fast_frames = 0
+            return
+
+        if self.lod_particles > 0 and nb_particles >= self.lod_particles * self.lod_scale:
+            self.particle_lod = "density"
+            self.lod_reason = "count"
+            self.lod_switch_count = self.lod_particles * self.lod_scale
+            return
+
+        if self.lod_frame_time > 0 and frame_time is not None:
+            if frame_time <= self.lod_frame_time:
+                self.lod_slow_frames = 0
+                self.lod_fast_frames += 1
+                # A retry that stayed fast long enough resets the back-off
+                if self.lod_reason == "time" and self.lod_fast_frames >= self.lod_retry_frames:
+                    self.lod_reason = None
+                    self.lod_retry_frames = 60
+                return
+
+            self.lod_slow_frames += 1
+            if self.lod_slow_frames >= 3:
+                # Back off the next retry if the last one was slow again (capped at about 30 s at 60 fps)
+                if self.lod_reason == "time":
+                    self.lod_retry_frames = min(2 * self.lod_retry_frames, 1920)
+                self.particle_lod = "density"
+                self.lod_reason = "time"
+                self.lod_fast_frames = 0
+
+    def renderStaticLayer(self, simulation):
+        """Renders the static geometry into the static layer: the solids or the wires rasterized with their depth, or the
+        pygame-drawn points with their depth recorded, so that the particles drawn over the layer are depth-tested
+        against it
+
+        Parameters
+        ----------
+        simulation : Simulation
+            The simulation to draw
+        """
+
+        # Clear the screen (the tile renderer clears each tile itself)
+        if self.tile_renderer is None:
+            self.framebuffer.clear(self.consts["color_bg"])
+        if self.render_mode == "solid":
+            self.rasterizeSolids(simulation)
+        if self.tile_renderer is not None:
+            self.tile_renderer.render(self.framebuffer, self.consts["color_bg"])
+        if self.render_mode == "wireframe":
+            self.renderGameObjects(simulation)
+        self.framebuffer.blit(self.screen)
+
+        if self.render_mode == "points":
+            self.renderGameObjects(simulation)
 
-            
+        self.static_layer.readColor(self.screen)
+        self.static_layer.depth[:] = self.framebuffer.depth
 
-    def renderGameObjects(self, simulation, camera_rotation_matrix):
-        """Renders the gameObjects on the screen using the provided simulation class
+    def getStaticKey(self, simulation):
+        """Returns the state the static layer depends on: the camera, the window, the render mode and the scene
 
         Parameters
         ----------
         simulation : Simulation
             The simulation to draw
-        camera_rotation_matrix : numpy.ndarray
-            The rotation matrix of the camera
+
+        Returns
+        -------
+        tuple
+            The key, the static layer is rendered again when it changes
         """
 
-        # Math out the 3d points on the canvas (1 unit away from the camera)
+        return (tuple(self.camera["position"]), tuple(self.camera["rotation"]), self.camera["fov"],
+                tuple(self.resolution), self.render_mode, self.static_version,
+                tuple((id(object), object.version) for object in simulation.gameObjects),
+                tuple(id(fluid.bounds_object) for fluid in simulation.fluids))
 
-        if (self.render_mode == "points"):
-            self.draw_as_points(simulation, camera_rotation_matrix)
-        elif (self.render_mode == "wireframe"):
-            self.draw_as_wires(simulation, camera_rotation_matrix)
-        elif (self.render_mode == "solid"):
-            self.draw_as_solids(simulation, camera_rotation_matrix)
+    def invalidateStatic(self):
+        """Forces the static layer to be rendered again on the next frame, after the scene was changed in place"""
 
-    def draw_as_points(self, simulation, camera_rotation_matrix):
-        """Draws the simulation as points on the screen using the provided simulation class
+        self.static_version += 1
+
+    def getParticlesRegion(self, projected):
+        """Returns the screen rectangle covered by the particles
+
+        Parameters
+        ----------
+        projected : list
+            The projected particles of each fluid, see projectFluids
+
+        Returns
+        -------
+        tuple
+            The (x0, y0, x1, y1) rectangle, None if no particle is visible
+        """
+
+        region = None
+        for points_2D, _, radii in projected:
+            if len(points_2D) == 0:
+                continue
+
+            # Density bins span bin_size pixels, splatted discs their rounded radius, circles their fixed radius
+            if self.particle_lod == "density":
+                extent = self.lod_bin_size
+            else:
+                extent = (np.rint(radii.max()) if self.particle_draw == "splat" else self.getCircleRadius()) + 1
+            low = np.floor(points_2D.min(axis=0) - extent).astype(int)
+            high = np.ceil(points_2D.max(axis=0) + extent + 1).astype(int)
+            region = raster.unionRegion(region, (max(low[0], 0), max(low[1], 0),
+                                          min(high[0], self.framebuffer.resolution[0]),
+                                          min(high[1], self.framebuffer.resolution[1])))
+
+        return region
+
+    def getOverlayRegion(self):
+        """Returns the screen rectangle of the overlay, if it is shown now or was on the last frame
+
+        Returns
+        -------
+        tuple
+            The (x0, y0, x1, y1) rectangle, None if the overlay is hidden
+        """
+
+        if not (self.show_overlay or self.overlay_shown):
+            return None
+
+        x0 = int(self.consts["overlay_pos"][0]/100 * self.resolution[0])
+        y0 = int(self.consts["overlay_pos"][1]/100 * self.resolution[1])
+        x1 = x0 + int(self.consts["overlay_size"][0]/100 * self.resolution[0]) + 1
+        y1 = y0 + int(self.consts["overlay_size"][1]/100 * self.resolution[1]) + 1
+
+        return (x0, y0, min(x1, self.framebuffer.resolution[0]), min(y1, self.framebuffer.resolution[1]))
+
+    def rasterizeSolids(self, simulation):
+        """Rasterizes the gameObjects and the fluids' bounding boxes into the frame buffer
 
         Parameters
         ----------
         simulation : Simulation
             The simulation to draw
-        camera_rotation_matrix : numpy.ndarray
-            The rotation matrix of the camera
         """
 
-        for object in simulation.gameObjects:
-            self.draw_object_as_points(object, camera_rotation_matrix)
+        for object in self.getVisibleGameObjects(simulation):
+            self.draw_object_as_solids(object)
+        for fluid in simulation.fluids:
+            self.draw_object_as_solids(fluid.bounds_object)
 
-    def draw_object_as_points(self, object, camera_rotation_matrix):
-        """Draws the object as points on the screen using the provided object and camera rotation matrix
+    def projectFluids(self, positions):
+        """Projects the particles of each fluid, keeping the visible ones, with their depths and their radii in pixels,
+        which follow their distance to the camera
 
         Parameters
         ----------
-        object : GameObject
-            The object to draw
-        camera_rotation_matrix : numpy.ndarray
-            The rotation matrix of the camera
+        positions : list
+            The particle positions of each fluid
+
+        Returns
+        -------
+        list
+            A (points_2D, depths, radii) tuple per fluid
         """
 
-        for point in object.points:
-            point_2D = self.vec3tovec2(point, camera_rotation_matrix)
-            color = self.getColor(point)
+        # Radius in pixels of a particle one unit away from the camera
+        focal_length = self.resolution[1]/2 / math.tan(math.radians(self.camera["fov"])/2)
+        unit_radius = self.consts["particle_radius"] * self.particle_scale * focal_length
 
-            if point_2D == (-1, -1):
-                continue
+        projected = []
+        for p_positions in positions:
+            points_2D, visible, depths = self.projectPoints(p_positions, return_depth=True)
+            depths = depths[visible]
 
-            # Draw the point
-            pygame.draw.circle(self.screen, color, point_2D, 3)
+            radii = np.clip(unit_radius / depths, 1, self.consts["particle_max_radius"])
+            projected.append((points_2D[visible], depths, radii))
+
+        return projected
+
+    def splatFluids(self, projected, region=None):
+        """Splats the projected particles into the frame buffer, as discs with a depth test
+
+        Parameters
+        ----------
+        projected : list
+            The projected particles of each fluid, see projectFluids
+        region : tuple
+            The (x0, y0, x1, y1) rectangle drawn to, the whole buffer by default
+        """
+
+        for points_2D, depths, radii in projected:
+            raster.splatPoints(self.framebuffer, points_2D, depths, radii, self.consts["color_fluid"], region)
 
-    def draw_as_solids(self, simulation, camera_rotation_matrix):
-        """Draws the simulation as solids on the screen using the provided simulation class
+    def renderFluids(self, projected):
+        """Renders the projected particles on the screen, one circle each, when they are not splatted
+
+        Parameters
+        ----------
+        projected : list
+            The projected particles of each fluid, see projectFluids
+        """
+
+        color = self.consts["color_fluid"]
+        radius = self.getCircleRadius()
+        for points_2D, _, _ in projected:
+            for point_2D in points_2D:
+                # Draw the point
+                pygame.draw.circle(self.screen, color, point_2D, radius)
+
+    def getCircleRadius(self):
+        """Returns the radius in pixels of the particles drawn as circles, 3 at full particle scale"""
+
+        return max(1, round(3 * self.particle_scale))
+
+    def renderGameObjects(self, simulation):
+        """Renders the visible gameObjects and the fluids' bounding boxes according to the current render mode
 
         Parameters
         ----------
         simulation : Simulation
             The simulation to draw
-        camera_rotation_matrix : numpy.ndarray
-            The rotation matrix of the camera
         """
 
-        for object in simulation.gameObjects:
-            self.draw_object_as_solids(object, camera_rotation_matrix)
+        for object in self.getVisibleGameObjects(simulation):
+            self.draw_object(object)
+        for fluid in simulation.fluids:
+            # Draw the bounding box
+            self.draw_object(fluid.bounds_object)
 
-    def draw_object_as_solids(self, object, camera_rotation_matrix):
-        """Draws the simulation as solids on the screen using the provided simulation class
+    def getVisibleGameObjects(self, simulation):
+        """Returns the gameObjects overlapping the camera frustum, found by testing a bounding volume hierarchy over
+        them against the frustum planes. The hierarchy is built again when the gameObjects or their versions change.
 
         Parameters
         ----------
         simulation : Simulation
             The simulation to draw
-        camera_rotation_matrix : numpy.ndarray
-            The rotation matrix of the camera
+
+        Returns
+        -------
+        list
+            The visible gameObjects
         """
 
-        # 12 colors
-        colors = [
-            (255, 0, 0),
-            (255, 127, 0),
-            (255, 255, 0),
-            (127, 255, 0),
-            (0, 255, 0),
-            (0, 255, 127),
-            (0, 255, 255),
-            (0, 127, 255),
-            (0, 0, 255),
-            (127, 0, 255),
-            (255, 0, 255),
-            (255, 0, 127)
-        ]
+        key = tuple((id(object), object.version) for object in simulation.gameObjects)
+        if key != self.bvh_key:
+            self.bvh = culling.BoundingVolumeHierarchy(simulation.gameObjects)
+            self.bvh_key = key
 
-        pre_baked_points = []
-        pre_baked_colors = []
+        return self.bvh.query(culling.frustumPlanes(self.getViewProjectionMatrix()))
 
-        for point in object.points:
-            pre_baked_points.append(self.vec3tovec2(point, camera_rotation_matrix))
-            # pre_baked_colors.append(self.getColor(point))
+    def draw_object(self, object):
+        """Draws the object according to the current render mode: points on the screen, wires into the frame buffer.
+        Solids are rasterized into the frame buffer by rasterizeSolids, so nothing is left to draw here in solid mode.
+
+        Parameters
+        ----------
+        object : GameObject
+            The object to draw
+        """
 
-        for i, face in enumerate(object.faces):
+        if (self.render_mode == "points"):
+            self.draw_object_as_points(object)
+        elif (self.render_mode == "wireframe"):
+            self.draw_object_as_wires(object)
 
-            # Project the face's points
-            face_2D = [
-                pre_baked_points[face[0] - 1],
-                pre_baked_points[face[1] - 1],
-                pre_baked_points[face[2] - 1],
-            ]
-            color = colors[i % 12]
+    def draw_object_as_points(self, object):
+        """Draws the object as points on the screen
 
-            # If one of the points is behind the camera, don't render the face
-            if face_2D[0] == (-1, -1) or face_2D[1] == (-1, -1) or face_2D[2] == (-1, -1):
-                continue
+        Parameters
+        ----------
+        object : GameObject
+            The object to draw
+        """
 
-            # If the winding order is CCW, don't render the face
-            abX = face_2D[1][0] - face_2D[0][0]
-            abY = face_2D[1][1] - face_2D[0][1]
-            acX = face_2D[2][0] - face_2D[0][0]
-            acY = face_2D[2][1] - face_2D[0][1]
+        points, _ = self.getRenderGeometry(object)
+        points_2D, visible, depths = self.projectPoints(points, return_depth=True)
+        colors = self.getVertexColors(object, points)
 
-            if (abX * acY - abY * acX) < 0:
-                continue
+        for color, point_2D in zip(colors[visible].tolist(), points_2D[visible]):
+            # Draw the point
+            pygame.draw.circle(self.screen, color, point_2D, 3)
 
-            # Color gradient not implemented
-            pygame.draw.polygon(self.screen, color, face_2D)
+        # Record the points' depth for the particles drawn over the static layer, over discs of radius 4 covering the
+        # circles (the frame buffer's colors were already blitted, they are replaced by the screen's in the static layer)
+        raster.splatPoints(self.framebuffer, points_2D[visible], depths[visible], np.full(np.count_nonzero(visible), 4),
+                           self.consts["color_points"])
 
-    def draw_as_wires(self, simulation, camera_rotation_matrix):
-        """Draws the simulation as wireframes on the screen using the provided simulation class
+    def draw_object_as_solids(self, object):
+        """Rasterizes the object's faces into the frame buffer, with a depth test against everything already in it
 
         Parameters
         ----------
-        simulation : Simulation
-            The simulation to draw
-        camera_rotation_matrix : numpy.ndarray 
-            The rotation matrix of the camera
+        object : GameObject
+            The object to draw
         """
 
-        for object in simulation.gameObjects:
-            self.draw_object_as_wires(object, camera_rotation_matrix)
+        points, faces = self.getRenderGeometry(object)
+        if len(faces) == 0:
+            return
+
+        points_2D, _, depths = self.projectPoints(points, return_depth=True)
+
+        # If one of the points is behind the camera, don't render the face. Faces partly off screen are clipped by the
+        # rasterizer
+        drawn = (depths > self.camera["nearClip"])[faces].all(axis=1)
+
+        # If the winding order is CCW, don't render the face
+        faces_2D = points_2D[faces]
+        ab = faces_2D[:, 1] - faces_2D[:, 0]
+        ac = faces_2D[:, 2] - faces_2D[:, 0]
+        drawn &= (ab[:, 0] * ac[:, 1] - ab[:, 1] * ac[:, 0]) >= 0
 
-    def draw_object_as_wires(self, object, camera_rotation_matrix):
+        # Color gradient not implemented, the faces of the mesh cycle through 12 colors, the same for every instance
+        drawn = np.flatnonzero(drawn)
+        colors = self.face_colors[drawn % len(object.faces) % 12]
+        if self.tile_renderer is not None:
+            self.tile_renderer.addTriangles(faces_2D[drawn], depths[faces[drawn]], colors)
+        else:
+            raster.rasterTriangles(self.framebuffer, faces_2D[drawn], depths[faces[drawn]], colors)
+
+    def draw_object_as_wires(self, object):
         """
-        Draws the object as wireframes on the screen using the provided object and camera rotation matrix
+        Draws the object as wireframes into the frame buffer. Each edge shared by several faces is drawn once, in the
+        color of its first point, and all the edges are rasterized together.
 
         Parameters
         ----------
         object : GameObject
             The object to draw
-        camera_rotation_matrix : numpy.ndarray
         """
 
-        pre_baked_points = []
-        pre_baked_colors = []
-        for point in object.points:
-            pre_baked_points.append(self.vec3tovec2(point, camera_rotation_matrix))
-            pre_baked_colors.append(self.getColor(point))
+        points, edges = self.getRenderGeometry(object, object.edges)
+        points_2D, visible, depths = self.projectPoints(points, return_depth=True)
+        colors = self.getVertexColors(object, points)
 
-        for face in object.faces:
+        # The wires are written into the depth buffer, so that the particles drawn over the static layer are hidden
+        # behind them
+        edges = edges[visible[edges].all(axis=1)]
+        raster.rasterLines(self.framebuffer, points_2D[edges[:, 0]], points_2D[edges[:, 1]], colors[edges[:, 0]],
+                           depths[edges])
 
-            if pre_baked_points[face[0] - 1] == (-1, -1) or pre_baked_points[face[1] - 1] == (-1, -1) or pre_baked_points[face[2] - 1] == (-1, -1):
-                continue
+    def getRenderGeometry(self, object, indices=None):
+        """Returns the world-space points and 0-based faces to draw for an object. The world-space points of a plain
+        object are cached by the object, so the model transform is skipped while it does not move. The instances of an
+        instanced object are culled against the camera frustum by bounding sphere, then the visible ones are transformed
+        in one batched operation and their faces offset into one array.
+
+        Parameters
+        ----------
+        object : GameObject
+            The object
+        indices : numpy.ndarray
+            The 0-based point indices to return in place of the faces, e.g. the edges
+
+        Returns
+        -------
+        points : numpy.ndarray
+            An (N, 3) array of points
+        faces : numpy.ndarray
+            An (M, 3) array of point indices, or the indices offset for each instance
+        """
 
-            face_2D = [
-                pre_baked_points[face[0] - 1],
-                pre_baked_points[face[1] - 1],
-                pre_baked_points[face[2] - 1]]
-            colors = [
-                pre_baked_colors[face[0] - 1],
-                pre_baked_colors[face[1] - 1],
-                pre_baked_colors[face[2] - 1]
-            ]
+        faces = self.getFaceIndices(object) if indices is None else indices
+        # Only instanced objects carry per-instance transforms
+        if not hasattr(object, "transforms"):
+            return object.worldPoints(), faces
 
-            pygame.draw.line(self.screen, colors[0], face_2D[0], face_2D[1], 1)
-            pygame.draw.line(self.screen, colors[1], face_2D[1], face_2D[2], 1)
-            pygame.draw.line(self.screen, colors[2], face_2D[2], face_2D[0], 1)
+        planes = culling.frustumPlanes(self.getViewProjectionMatrix())
+        centers, radii = object.instanceSpheres()
+        instances = np.flatnonzero((centers @ planes[:, :3].T + planes[:, 3] >= -radii[:, np.newaxis]).all(axis=1))
 
+        points = object.worldPoints(instances)
+        nb_points = points.shape[1]
+        faces = (faces[np.newaxis] + (np.arange(len(instances)) * nb_points)[:, np.newaxis, np.newaxis])
 
-    # Main projection function: From world space to screen space
-    def vec3tovec2(self, point, camera_rotation_matrix):
-        """Converts a 3d point to a 2d point on the screen
+        return points.reshape(-1, 3), faces.reshape(-1, faces.shape[-1])
+
+    def getVertexColors(self, object, points):
+        """Returns the colors of the points drawn for an object, cached by plain objects until they move
 
         Parameters
         ----------
-        point : numpy.ndarray
-            The point to convert
-        camera_rotation_matrix : numpy.ndarray
-            The rotation matrix of the camera
+        object : GameObject
+            The object
+        points : numpy.ndarray
+            The (N, 3) points returned by getRenderGeometry
 
         Returns
         -------
-        tuple
-            The 2d point on the screen
+        numpy.ndarray
+            An (N, 3) array of colors
+        """
+
+        if hasattr(object, "transforms"):
+            return self.getColors(points)
+
+        return object.vertexColors(self.getColors)
+
+    def getFaceIndices(self, object):
+        """Returns the faces of the object as an (M, 3) array of 0-based point indices
+
+        Parameters
+        ----------
+        object : GameObject
+            The object
+
+        Returns
+        -------
+        numpy.ndarray
+            The faces
         """
 
-        # To determine a point's position on the screen:
-        # - Express the point's position in camera coordinates
-        # - Apply the rotation of the camera
-        # - Apply homogenous coordinates
-        # - Normalize the 2d vector
+        return np.asarray(object.faces, dtype=np.intp).reshape(-1, 3) - 1
+
+    # Main projection function: From world space to screen space
+    def projectPoints(self, points, return_depth=False):
+        """Converts an array of 3d points to 2d points on the screen, with a single matrix multiply
+
+        Parameters
+        ----------
+        points : numpy.ndarray
+            An (N, 3) array of points
+        return_depth : bool
+            Whether to also return the distance of the points along the camera's axis
 
-        camera_position = self.camera["position"]
+        Returns
+        -------
+        points_2D : numpy.ndarray
+            An (N, 2) array of screen coordinates
+        visible : numpy.ndarray
+            An (N,) boolean array, False for the points behind the camera or outside of the screen
+        depths : numpy.ndarray
+            An (N,) array of depths, if return_depth is set
+        """
 
-        # Apply change of origin and apply orientation
-        point = np.matmul(camera_rotation_matrix, (point - camera_position))
+        # To determine the points' positions on the screen:
+        # - Apply the view-projection matrix (change of origin, camera rotation and projection) in homogenous coordinates
+        # - Normalize the 2d vectors
+        # - Apply the viewport transformation
 
-        # Apply homogenous coordinates
-        point = np.array([point[0], point[1], point[2], 1])
+        view_projection_matrix = self.getViewProjectionMatrix()
 
-        # Apply projection matrix
-        point = np.matmul(self.projection_matrix, point)
+        points = np.asarray(points).reshape(-1, 3)
+        clip = points @ view_projection_matrix[:, :3].T + view_projection_matrix[:, 3]
 
         # Remove points behind the camera
-        if point[2] < 0:
-            return (-1, -1)
+        visible = clip[:, 2] >= 0
 
-        # Normalize the vector
-        point /= point[3]
+        # Normalize the vectors (points behind the camera may divide by zero, they are discarded anyway)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            ndc = clip[:, :2] / clip[:, 3:4]
 
         # Remove points outside of NDC space
-        if point[0] < -1 or point[0] > 1 or point[1] < -1 or point[1] > 1:
+        visible &= (np.abs(ndc) <= 1).all(axis=1)
+
+        # Apply viewport transformation and offset
+        points_2D = np.empty((len(points), 2))
+        points_2D[:, 0] = self.resolution[0]/2 + ndc[:, 0] * self.resolution[0]/2
+        points_2D[:, 1] = self.resolution[1]/2 - ndc[:, 1] * self.resolution[1]/2
+
+        if return_depth:
+            return points_2D, visible, clip[:, 3]
+
+        return points_2D, visible
+
+    def vec3tovec2(self, point):
+        """Converts a single 3d point to a 2d point on the screen
+
+        Parameters
+        ----------
+        point : numpy.ndarray
+            The point to convert
+
+        Returns
+        -------
+        tuple
+            The 2d point on the screen, (-1, -1) if it isn't visible
+        """
+
+        points_2D, visible = self.projectPoints(point)
+
+        if not visible[0]:
             return (-1, -1)
 
-        # Apply viewport transformation
-        point[0] = point[0] * self.resolution[0]/2
-        point[1] = point[1] * self.resolution[1]/2
+        return (points_2D[0, 0], points_2D[0, 1])
+
+    def getViewProjectionMatrix(self):
+        """Returns the combined view-projection matrix, only rebuilt when the camera's position, rotation, fov, clipping
+        planes or the resolution changed
+
+        Returns
+        -------
+        numpy.ndarray
+            The 4x4 view-projection matrix
+        """
+
+        key = (tuple(self.camera["position"]), tuple(self.camera["rotation"]), self.camera["fov"],
+               self.camera["nearClip"], self.camera["farClip"], tuple(self.resolution))
+
+        if key != self.view_projection_key:
+            rotation_matrix = self.getCameraRotationMatrix()
+
+            # Change of origin followed by the camera's orientation
+            view_matrix = np.identity(4)
+            view_matrix[:3, :3] = rotation_matrix
+            view_matrix[:3, 3] = -rotation_matrix @ self.camera["position"]
 
-        # Apply offset
-        screen_x = self.resolution[0]/2 + point[0]
-        screen_y = self.resolution[1]/2 - point[1]
+            self.projection_matrix = self.getProjectionMatrix()
+            self.view_projection_matrix = self.projection_matrix @ view_matrix
+            self.view_projection_key = key
 
-        return (screen_x, screen_y)
+        return self.view_projection_matrix
 
     def drawOverlay(self):
-        """Draws the overlay on the screen
+        """Draws the overlay on the screen. The font and the background are created once, text lines are only rendered
+        again when they change, and the HUD surface is only composed again when a line did. The frame timings are
+        refreshed every overlay_stats_interval seconds so that they stay readable.
         """
 
-        font = pygame.font.SysFont("Roboto", 30)
-
         overlay_w = self.consts["overlay_size"][0]/100 * self.resolution[0]
         overlay_h = self.consts["overlay_size"][1]/100 * self.resolution[1]
 
-        hud = pygame.Surface((overlay_w, overlay_h), pygame.SRCALPHA)
+        if self.overlay_font is None:
+            self.overlay_font = pygame.font.SysFont("Roboto", 30)
+
+        # The background only changes with the window size
+        if self.overlay_background is None or self.overlay_background.get_size() != (int(overlay_w), int(overlay_h)):
+            self.overlay_background = pygame.Surface((overlay_w, overlay_h), pygame.SRCALPHA)
 
-        pygame.draw.rect(hud, self.consts["color_overlay_bg"],
-                         (0, 0, overlay_w, overlay_h), 0, 10)
-        pygame.draw.rect(hud, self.consts["color_overlay_border"],
-                         (0, 0, overlay_w, overlay_h), 2, 10)
+            pygame.draw.rect(self.overlay_background, self.consts["color_overlay_bg"],
+                             (0, 0, overlay_w, overlay_h), 0, 10)
+            pygame.draw.rect(self.overlay_background, self.consts["color_overlay_border"],
+                             (0, 0, overlay_w, overlay_h), 2, 10)
+
+            self.overlay_hud = None
 
         # Overlay content
-        text = []
-
-        # Camera Position
-        text.append(
-            font.render(
-                "Camera: " + str([round(num, 2) for num in self.camera["position"]]),
-                True, self.consts["color_overlay_txt"]))
-        # Camera Rotation
-        text.append(font.render("Camera rotation: " + str([round(np.degrees(num), 2)
-                    for num in self.camera["rotation"]]), True, self.consts["color_overlay_txt"]))
-        # FOV
-        text.append(font.render("FOV: " + str(round(self.camera["fov"], 2)),
-                    True, self.consts["color_overlay_txt"]))
-
-        for i in range(len(text)):
-            rect = text[i].get_rect(
-                centery=((i+1)*overlay_h/(len(text)+1)), left=10)
-            hud.blit(text[i], rect)
-
-        self.screen.blit(hud, (self.consts["overlay_pos"][0]/100 * self.resolution
-                          [0], self.consts["overlay_pos"][1]/100 * self.resolution[1]))
-
-    def drawGrid(self, camera_rotation_matrix):
-        """Draws the grid on the screen
+        lines = [
+            # Camera Position
+            "Camera: " + str([round(float(num), 2) for num in self.camera["position"]]),
+            # Camera Rotation
+            "Camera rotation: " + str([round(float(np.degrees(num)), 2) for num in self.camera["rotation"]]),
+            # FOV
+            "FOV: " + str(round(self.camera["fov"], 2)),
+        ]
+        lines += self.getTimingLines()
 
-        Parameters
-        ----------
-        camera_rotation_matrix : numpy.ndarray
-            The rotation matrix of the camera
+        # Render the lines that changed
+        if len(self.overlay_lines) != len(lines):
+            self.overlay_lines = [(None, None)] * len(lines)
+            self.overlay_hud = None
+
+        for i, line in enumerate(lines):
+            if self.overlay_lines[i][0] != line:
+                self.overlay_lines[i] = (line, self.overlay_font.render(line, True, self.consts["color_overlay_txt"]))
+                self.overlay_hud = None
+
+        # Compose the HUD again if anything changed
+        if self.overlay_hud is None:
+            self.overlay_hud = self.overlay_background.copy()
+
+            for i, (_, text) in enumerate(self.overlay_lines):
+                rect = text.get_rect(centery=((i+1)*overlay_h/(len(lines)+1)), left=10)
+                self.overlay_hud.blit(text, rect)
+
+        self.screen.blit(self.overlay_hud, (self.consts["overlay_pos"][0]/100 * self.resolution
+                         [0], self.consts["overlay_pos"][1]/100 * self.resolution[1]))
+
+    def getTimingLines(self):
+        """Returns the overlay lines of the frame time breakdown and of the quality governor's decisions, refreshed every
+        overlay_stats_interval seconds
+
+        Returns
+        -------
+        list
+            The lines, empty without a frame timer or a quality governor
+        """
+
+        if self.frame_timer is None and self.quality_governor is None:
+            return []
+
+        now = time.perf_counter()
+        if self.overlay_timing_lines is None or now - self.overlay_timing_time >= self.consts["overlay_stats_interval"]:
+            self.overlay_timing_time = now
+            self.overlay_timing_lines = []
+
+            if self.quality_governor is not None:
+                self.overlay_timing_lines += self.quality_governor.describe()
+
+            for stage in (self.frame_timer.stages if self.frame_timer is not None else ()):
+                stats = self.frame_timer.stats(stage)
+                if stats is None:
+                    continue
+                self.overlay_timing_lines.append(
+                    f"{stage.capitalize()} (ms): min {stats[0]:.1f} / avg {stats[1]:.1f} / p99 {stats[2]:.1f}")
+
+        return self.overlay_timing_lines
+
+    def drawGrid(self):
+        """Draws the grid on the screen
         """
 
         x_limits = [-5, 5]
         z_limits = [-5, 5]
 
-        # Draw the grid
+        # Start and end points of every line of the grid
+        lines = []
         for i in range(x_limits[0], x_limits[1] + 1):
-            point_s = [x_limits[0], 0, i]
-            point_e = [x_limits[1], 0, i]
-            coords_s = self.vec3tovec2(point_s, camera_rotation_matrix)
-            coords_e = self.vec3tovec2(point_e, camera_rotation_matrix)
-            color = (255, 255, 255)
-            pygame.draw.line(self.screen, color, coords_s, coords_e, 1)
-
+            lines.append(([x_limits[0], 0, i], [x_limits[1], 0, i]))
         for i in range(z_limits[0], z_limits[1] + 1):
-            point_s = [i, 0, z_limits[0]]
-            point_e = [i, 0, z_limits[1]]
-            coords_s = self.vec3tovec2(point_s, camera_rotation_matrix)
-            coords_e = self.vec3tovec2(point_e, camera_rotation_matrix)
-            color = (255, 255, 255)
+            lines.append(([i, 0, z_limits[0]], [i, 0, z_limits[1]]))
+        lines = np.array(lines, dtype=float)
+
+        points_2D, visible = self.projectPoints(lines.reshape(-1, 3))
+        points_2D = points_2D.reshape(-1, 2, 2)
+        visible = visible.reshape(-1, 2).all(axis=1)
+
+        # Draw the grid
+        color = (255, 255, 255)
+        for coords_s, coords_e in points_2D[visible]:
             pygame.draw.line(self.screen, color, coords_s, coords_e, 1)
 
     def updateVarsOnResize(self):
@@ -423,7 +904,7 @@ class Rendering:
         """
 
         self.resolution = pygame.display.get_surface().get_size()
-        self.projection_matrix = self.getProjectionMatrix(self.camera, self.resolution)
+        self.projection_matrix = self.getProjectionMatrix()
 
     # Returns the projection matrix from current simVars (mostly run when window is resized and on init)
 
@@ -483,6 +964,30 @@ class Rendering:
 
         return (color)
 
+    def getColors(self, points):
+        """Retrieves the color values of an array of points, the same gradient as getColor
+
+        Parameters
+        ----------
+        points : numpy.ndarray
+            An (N, 3) array of points
+
+        Returns
+        -------
+        numpy.ndarray
+            An (N, 3) array of uint8 colors
+        """
+
+        points = np.asarray(points, dtype=float).reshape(-1, 3)
+        ratios = np.clip(np.sqrt((points ** 2).sum(axis=1)), 0, 5)[:, np.newaxis] / 5
+
+        colors = np.array([255, 0, 0]) + ratios * np.array([42 - 255, 85, 91])
+
+        # Deal with NaN error values
+        colors[np.isnan(ratios[:, 0])] = (0, 255, 0)
+
+        return colors.astype(np.uint8)
+
     # Returns the rotation matrix from the camera's orientation
 
     def getCameraRotationMatrix(self):
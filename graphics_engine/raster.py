@@ -0,0 +1,617 @@
+import pygame
+
+import numpy as np
+
+import concurrent.futures
+
+# ----------------------------------------
+# NumPy frame buffer and rasterization
+# ----------------------------------------
+
+
+class FrameBuffer:
+    """A color buffer and a depth buffer written to with array operations, then blitted to a pygame surface at once.
+    Both buffers are indexed [x, y] like pygame.surfarray.
+
+    Parameters
+    ----------
+    resolution : tuple
+        The width and height of the buffers
+    """
+
+    def __init__(self, resolution):
+        self.resize(resolution)
+
+    def resize(self, resolution):
+        """Reallocates the buffers for a new resolution
+
+        Parameters
+        ----------
+        resolution : tuple
+            The width and height of the buffers
+        """
+
+        self.resolution = (int(resolution[0]), int(resolution[1]))
+        self.color = np.zeros((self.resolution[0], self.resolution[1], 3), dtype=np.uint8)
+        self.depth = np.full(self.resolution, np.inf, dtype=np.float32)
+
+    def clear(self, color, region=None):
+        """Fills the color buffer with a color and resets the depth buffer
+
+        Parameters
+        ----------
+        color : tuple
+            The background color
+        region : tuple
+            The (x0, y0, x1, y1) rectangle to clear, the whole buffer by default
+        """
+
+        x0, y0, x1, y1 = region or (0, 0, *self.resolution)
+        self.color[x0:x1, y0:y1] = color
+        self.depth[x0:x1, y0:y1] = np.inf
+
+    def copyFrom(self, other, region=None):
+        """Copies the color and depth buffers of another frame buffer of the same size
+
+        Parameters
+        ----------
+        other : FrameBuffer
+            The frame buffer copied from
+        region : tuple
+            The (x0, y0, x1, y1) rectangle to copy, the whole buffer by default
+        """
+
+        x0, y0, x1, y1 = region or (0, 0, *self.resolution)
+        self.color[x0:x1, y0:y1] = other.color[x0:x1, y0:y1]
+        self.depth[x0:x1, y0:y1] = other.depth[x0:x1, y0:y1]
+
+    def readColor(self, surface):
+        """Copies the pixels of a surface of the same size into the color buffer
+
+        Parameters
+        ----------
+        surface : pygame.Surface
+            The surface
+        """
+
+        pixels = pygame.surfarray.pixels3d(surface)
+        self.color[:] = pixels
+        del pixels
+
+    def blit(self, surface, region=None):
+        """Copies the color buffer onto a surface of the same size
+
+        Parameters
+        ----------
+        surface : pygame.Surface
+            The surface
+        region : tuple
+            The (x0, y0, x1, y1) rectangle to copy, the whole buffer by default
+        """
+
+        if region is None:
+            pygame.surfarray.blit_array(surface, self.color)
+            return
+
+        x0, y0, x1, y1 = region
+        pixels = pygame.surfarray.pixels3d(surface)
+        pixels[x0:x1, y0:y1] = self.color[x0:x1, y0:y1]
+        del pixels
+
+
+def unionRegion(a, b):
+    """Returns the smallest (x0, y0, x1, y1) rectangle containing two rectangles, either of which may be None
+
+    Parameters
+    ----------
+    a : tuple
+        The first rectangle
+    b : tuple
+        The second rectangle
+
+    Returns
+    -------
+    tuple
+        The union rectangle
+    """
+
+    if a is None:
+        return b
+    if b is None:
+        return a
+
+    return (min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3]))
+
+
+def splatPoints(framebuffer, points_2D, depths, radii, color, region=None):
+    """Draws points as filled discs into the frame buffer with a per-pixel nearest-depth test. The points are grouped by
+    rounded radius and every pixel covered by each group's discs is generated as one array.
+
+    Parameters
+    ----------
+    framebuffer : FrameBuffer
+        The frame buffer
+    points_2D : numpy.ndarray
+        An (N, 2) array of screen coordinates
+    depths : numpy.ndarray
+        An (N,) array of the points' distances to the camera
+    radii : numpy.ndarray
+        An (N,) array of disc radii, in pixels
+    color : tuple
+        The color of the points
+    region : tuple
+        The (x0, y0, x1, y1) rectangle drawn to, the whole buffer by default
+    """
+
+    if len(points_2D) == 0:
+        return
+
+    x0, y0, x1, y1 = region or (0, 0, *framebuffer.resolution)
+    height = framebuffer.resolution[1]
+
+    centers = np.floor(points_2D).astype(np.intp)
+    rounded_radii = np.rint(radii).astype(np.intp)
+
+    pixel_indices = []
+    pixel_depths = []
+    for radius in np.unique(rounded_radii):
+        selected = rounded_radii == radius
+        offsets_x, offsets_y = discOffsets(radius)
+
+        xs = (centers[selected, 0][:, np.newaxis] + offsets_x).ravel()
+        ys = (centers[selected, 1][:, np.newaxis] + offsets_y).ravel()
+        fragment_depths = np.repeat(depths[selected], len(offsets_x))
+        inside = (xs >= x0) & (xs < x1) & (ys >= y0) & (ys < y1)
+
+        pixel_indices.append(xs[inside] * height + ys[inside])
+        pixel_depths.append(fragment_depths[inside])
+
+    writeNearest(framebuffer, np.concatenate(pixel_indices), np.concatenate(pixel_depths).astype(np.float32), color)
+
+
+_disc_offsets = {}
+
+
+def discOffsets(radius):
+    """Returns the pixel offsets covered by a disc of the given radius (cached)
+
+    Parameters
+    ----------
+    radius : int
+        The radius of the disc, in pixels
+
+    Returns
+    -------
+    offsets_x : numpy.ndarray
+        The x offsets
+    offsets_y : numpy.ndarray
+        The y offsets
+    """
+
+    if radius not in _disc_offsets:
+        offset_range = np.arange(-radius, radius + 1)
+        offsets_x, offsets_y = np.meshgrid(offset_range, offset_range, indexing="ij")
+        covered = np.hypot(offsets_x, offsets_y) <= radius
+        _disc_offsets[radius] = (offsets_x[covered], offsets_y[covered])
+
+    return _disc_offsets[radius]
+
+
+def writeNearest(framebuffer, pixel_indices, pixel_depths, colors):
+    """Writes fragments into the frame buffer, keeping for each pixel the nearest of its fragments if it is nearer than
+    what the depth buffer already holds
+
+    Parameters
+    ----------
+    framebuffer : FrameBuffer
+        The frame buffer
+    pixel_indices : numpy.ndarray
+        An (M,) array of flat pixel indices (x * height + y)
+    pixel_depths : numpy.ndarray
+        An (M,) array of fragment depths
+    colors : numpy.ndarray
+        A single color, or an (M, 3) array of fragment colors
+    """
+
+    depth = framebuffer.depth.reshape(-1)
+    color = framebuffer.color.reshape(-1, 3)
+
+    # Nearest depth of each pixel, then the fragments that hold it
+    np.minimum.at(depth, pixel_indices, pixel_depths)
+    nearest = pixel_depths == depth[pixel_indices]
+
+    colors = np.asarray(colors)
+    color[pixel_indices[nearest]] = colors[nearest] if colors.ndim == 2 else colors
+
+
+def splatDensity(framebuffer, points_2D, bin_size, color, region=None):
+    """Draws points as a density image: they are binned into a screen-space histogram of bin_size pixels bins, and the
+    counts are tone-mapped logarithmically into the opacity of the color, blended over the frame buffer. The depth
+    buffer is left untouched.
+
+    Parameters
+    ----------
+    framebuffer : FrameBuffer
+        The frame buffer
+    points_2D : numpy.ndarray
+        An (N, 2) array of screen coordinates
+    bin_size : int
+        The width and height of the histogram bins, in pixels
+    color : tuple
+        The color of the densest bin
+    region : tuple
+        The (x0, y0, x1, y1) rectangle drawn to, the whole buffer by default
+    """
+
+    if len(points_2D) == 0:
+        return
+
+    x0, y0, x1, y1 = region or (0, 0, *framebuffer.resolution)
+    bins_x = -(-framebuffer.resolution[0] // bin_size)
+    bins_y = -(-framebuffer.resolution[1] // bin_size)
+
+    bin_indices = np.floor(points_2D / bin_size).astype(np.intp)
+    inside = (bin_indices[:, 0] >= 0) & (bin_indices[:, 0] < bins_x) & (bin_indices[:, 1] >= 0) & (bin_indices[:, 1] < bins_y)
+    counts = np.bincount(bin_indices[inside, 0] * bins_y + bin_indices[inside, 1],
+                         minlength=bins_x * bins_y).reshape(bins_x, bins_y)
+
+    # Tone-map over the whole image, so that every region of a frame uses the same scale
+    max_count = counts.max()
+    if max_count == 0:
+        return
+
+    # Bins overlapping the region, upscaled to pixels and cropped to it
+    first_x, first_y = x0 // bin_size, y0 // bin_size
+    last_x, last_y = -(-x1 // bin_size), -(-y1 // bin_size)
+    # Opacity out of 256, so that the blend stays in 16-bit integers
+    opacity = (np.log1p(counts[first_x:last_x, first_y:last_y]) * (256 / np.log1p(max_count))).astype(np.uint16)
+    opacity = opacity.repeat(bin_size, axis=0).repeat(bin_size, axis=1)
+    opacity = opacity[x0 - first_x * bin_size:x1 - first_x * bin_size, y0 - first_y * bin_size:y1 - first_y * bin_size]
+    opacity = opacity[:, :, np.newaxis]
+
+    pixels = framebuffer.color[x0:x1, y0:y1]
+    pixels[:] = (pixels * (256 - opacity) + np.asarray(color, dtype=np.uint16) * opacity) >> 8
+
+
+def rasterTriangles(framebuffer, triangles_2D, triangle_depths, colors, region=None, max_fragments=1 << 21):
+    """Fills triangles into the frame buffer with a per-pixel nearest-depth test. Bounding boxes, edge functions and
+    perspective-correct depths are computed as array operations over batches of triangles of similar size.
+
+    Parameters
+    ----------
+    framebuffer : FrameBuffer
+        The frame buffer
+    triangles_2D : numpy.ndarray
+        A (T, 3, 2) array of the triangles' screen coordinates
+    triangle_depths : numpy.ndarray
+        A (T, 3) array of the depths of the triangles' corners (all in front of the camera)
+    colors : numpy.ndarray
+        A (T, 3) array of the triangles' colors
+    region : tuple
+        The (x0, y0, x1, y1) rectangle drawn to, the whole buffer by default
+    max_fragments : int
+        The maximum number of candidate pixels generated at once
+    """
+
+    x0, y0, x1, y1 = region or (0, 0, *framebuffer.resolution)
+
+    # Bounding boxes, clamped to the region
+    box_min = np.floor(triangles_2D.min(axis=1)).astype(np.intp)
+    box_max = np.ceil(triangles_2D.max(axis=1)).astype(np.intp)
+    box_min[:, 0] = np.maximum(box_min[:, 0], x0)
+    box_min[:, 1] = np.maximum(box_min[:, 1], y0)
+    box_max[:, 0] = np.minimum(box_max[:, 0], x1)
+    box_max[:, 1] = np.minimum(box_max[:, 1], y1)
+    box_size = box_max - box_min
+
+    # Twice the signed area, used to normalize the edge functions into barycentric coordinates
+    ab = triangles_2D[:, 1] - triangles_2D[:, 0]
+    ac = triangles_2D[:, 2] - triangles_2D[:, 0]
+    areas = ab[:, 0] * ac[:, 1] - ab[:, 1] * ac[:, 0]
+
+    kept = (box_size > 0).all(axis=1) & (np.abs(areas) > 1e-12)
+    if not kept.any():
+        return
+
+    triangles_2D = triangles_2D[kept]
+    inverse_depths = 1 / triangle_depths[kept]
+    colors = np.asarray(colors, dtype=np.uint8)[kept]
+    areas = areas[kept]
+    box_min = box_min[kept]
+    box_size = box_size[kept]
+
+    # Edge functions, E(x, y) = a x + b y + c, normalized into barycentric coordinates (positive inside whatever the
+    # winding) and expressed relative to the corner of the bounding box
+    edge_a = np.empty((len(areas), 3))
+    edge_b = np.empty((len(areas), 3))
+    edge_c = np.empty((len(areas), 3))
+    for i in range(3):
+        start_corner = triangles_2D[:, (i + 1) % 3]
+        end_corner = triangles_2D[:, (i + 2) % 3]
+        edge_a[:, i] = (start_corner[:, 1] - end_corner[:, 1]) / areas
+        edge_b[:, i] = (end_corner[:, 0] - start_corner[:, 0]) / areas
+        edge_c[:, i] = (edge_a[:, i] * (box_min[:, 0] + 0.5 - start_corner[:, 0])
+                        + edge_b[:, i] * (box_min[:, 1] + 0.5 - start_corner[:, 1]))
+
+    # Triangles are grouped by bounding box size rounded up to a power of two, so that padding the boxes of a group to
+    # the same size wastes little, and each group is split into batches of at most max_fragments candidate pixels
+    buckets = np.ceil(np.log2(box_size)).astype(np.intp)
+    bucket_keys = buckets[:, 0] * 64 + buckets[:, 1]
+    order = np.argsort(bucket_keys, kind="stable")
+    bucket_starts = np.flatnonzero(np.diff(bucket_keys[order], prepend=-1))
+    bucket_ends = np.append(bucket_starts[1:], len(order))
+
+    for bucket_start, bucket_end in zip(bucket_starts, bucket_ends):
+        bucket = order[bucket_start:bucket_end]
+        width = box_size[bucket, 0].max()
+        height = box_size[bucket, 1].max()
+
+        if width * height > max_fragments:
+            # Large triangles are filled one at a time, in bands of rows
+            band_height = max(1, max_fragments // width)
+            for triangle in bucket:
+                for band_start in range(0, box_size[triangle, 1], band_height):
+                    _rasterBatch(framebuffer, inverse_depths, colors, box_min, box_size, edge_a, edge_b, edge_c,
+                                 bucket[bucket == triangle], box_size[triangle, 0],
+                                 min(band_height, box_size[triangle, 1] - band_start), band_start)
+            continue
+
+        batch_size = max(1, max_fragments // (width * height))
+        for batch_start in range(0, len(bucket), batch_size):
+            _rasterBatch(framebuffer, inverse_depths, colors, box_min, box_size, edge_a, edge_b, edge_c,
+                         bucket[batch_start:batch_start + batch_size], width, height, 0)
+
+
+def _rasterBatch(framebuffer, inverse_depths, colors, box_min, box_size, edge_a, edge_b, edge_c, batch, width, height,
+                 row_offset):
+    """Rasterizes a batch of triangles over a (width, height) window of their bounding boxes, starting row_offset rows
+    into them"""
+
+    # Pixel offsets inside the bounding boxes: (B, width, 1) and (B, 1, height)
+    offsets_x = np.arange(width, dtype=np.float64)[np.newaxis, :, np.newaxis]
+    offsets_y = np.arange(row_offset, row_offset + height, dtype=np.float64)[np.newaxis, np.newaxis, :]
+
+    inside = (offsets_x < box_size[batch, 0][:, np.newaxis, np.newaxis]) \
+        & (offsets_y < box_size[batch, 1][:, np.newaxis, np.newaxis])
+
+    weights = []
+    for i in range(3):
+        weight = (edge_a[batch, i][:, np.newaxis, np.newaxis] * offsets_x
+                  + edge_b[batch, i][:, np.newaxis, np.newaxis] * offsets_y
+                  + edge_c[batch, i][:, np.newaxis, np.newaxis])
+        inside &= weight >= 0
+        weights.append(weight)
+
+    triangle_indices, pixel_x, pixel_y = np.nonzero(inside)
+    if len(triangle_indices) == 0:
+        return
+
+    # Perspective-correct depth: 1/z is linear in screen space
+    fragment_inverse_depths = (weights[0][inside] * inverse_depths[batch[triangle_indices], 0]
+                               + weights[1][inside] * inverse_depths[batch[triangle_indices], 1]
+                               + weights[2][inside] * inverse_depths[batch[triangle_indices], 2])
+
+    triangles = batch[triangle_indices]
+    pixel_indices = ((box_min[triangles, 0] + pixel_x) * framebuffer.resolution[1]
+                     + box_min[triangles, 1] + pixel_y + row_offset)
+
+    writeNearest(framebuffer, pixel_indices, (1 / fragment_inverse_depths).astype(np.float32), colors[triangles])
+
+
+def rasterLines(framebuffer, starts, ends, colors, depths=None, region=None, max_fragments=1 << 21):
+    """Draws one pixel wide line segments into the frame buffer. Every line is stepped one pixel at a time along its
+    major axis, the pixels of all the lines are generated as one array. With depths, the lines are depth-tested and
+    written into the depth buffer (1/z interpolated along the line), otherwise they are drawn over what is there.
+
+    Parameters
+    ----------
+    framebuffer : FrameBuffer
+        The frame buffer
+    starts : numpy.ndarray
+        An (L, 2) array of the lines' first end points, in screen coordinates
+    ends : numpy.ndarray
+        An (L, 2) array of the lines' last end points
+    colors : numpy.ndarray
+        An (L, 3) array of the lines' colors
+    depths : numpy.ndarray
+        An (L, 2) array of the depths of the lines' end points (in front of the camera), None to draw without depth
+    region : tuple
+        The (x0, y0, x1, y1) rectangle drawn to, the whole buffer by default
+    max_fragments : int
+        The maximum number of pixels generated at once
+    """
+
+    x0, y0, x1, y1 = region or (0, 0, *framebuffer.resolution)
+    if len(starts) == 0:
+        return
+
+    inverse_depths = None if depths is None else 1 / np.asarray(depths, dtype=float)
+
+    # Pixel coordinates, truncated like pygame.draw.line
+    starts = np.floor(starts).astype(np.intp)
+    deltas = np.floor(ends).astype(np.intp) - starts
+    colors = np.asarray(colors, dtype=np.uint8)
+
+    lengths = np.abs(deltas).max(axis=1) + 1
+    line_ends = np.cumsum(lengths)
+
+    # Batches of whole lines holding at most max_fragments pixels (a longer line makes a batch of its own)
+    batch_start = 0
+    while batch_start < len(lengths):
+        first_pixel = line_ends[batch_start] - lengths[batch_start]
+        batch_end = max(int(np.searchsorted(line_ends, first_pixel + max_fragments, side="right")), batch_start + 1)
+        batch = np.arange(batch_start, batch_end)
+        batch_start = batch_end
+
+        # The line and the step along it of each pixel
+        lines = np.repeat(batch, lengths[batch])
+        steps = np.arange(len(lines)) - np.repeat(line_ends[batch] - lengths[batch] - first_pixel, lengths[batch])
+        fractions = steps / np.maximum(lengths[lines] - 1, 1)
+
+        pixel_x = starts[lines, 0] + np.rint(fractions * deltas[lines, 0]).astype(np.intp)
+        pixel_y = starts[lines, 1] + np.rint(fractions * deltas[lines, 1]).astype(np.intp)
+
+        inside = (pixel_x >= x0) & (pixel_x < x1) & (pixel_y >= y0) & (pixel_y < y1)
+        if inverse_depths is None:
+            framebuffer.color[pixel_x[inside], pixel_y[inside]] = colors[lines[inside]]
+            continue
+
+        lines = lines[inside]
+        fractions = fractions[inside]
+        pixel_depths = 1 / ((1 - fractions) * inverse_depths[lines, 0] + fractions * inverse_depths[lines, 1])
+        writeNearest(framebuffer, pixel_x[inside] * framebuffer.resolution[1] + pixel_y[inside],
+                     pixel_depths.astype(np.float32), colors[lines])
+
+
+# ----------------------------------------
+# Tile-parallel rasterization
+# ----------------------------------------
+
+
+class TileRenderer:
+    """Rasterizes a frame as independent screen tiles on a persistent thread pool. Triangles and particles are queued
+    during the frame, binned into the tiles their bounding boxes overlap, and each tile is cleared and drawn by one
+    thread. The tiles cover disjoint pixels of the frame buffer. NumPy releases the GIL inside most of its array
+    operations, but not in np.minimum.at (the depth test), so the threads only partly overlap and the binning is pure
+    overhead on a single core: the renderer measures it before keeping it.
+
+    Parameters
+    ----------
+    tile_size : int
+        The width and height of the tiles, in pixels
+    nb_threads : int
+        The number of threads rasterizing tiles
+    """
+
+    def __init__(self, tile_size, nb_threads):
+        self.tile_size = tile_size
+        self.nb_threads = nb_threads
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=nb_threads, thread_name_prefix="raster")
+
+        self.triangles = []
+        self.splats = []
+
+    def addTriangles(self, triangles_2D, triangle_depths, colors):
+        """Queues triangles for the current frame, see rasterTriangles"""
+
+        if len(triangles_2D) > 0:
+            self.triangles.append((triangles_2D, triangle_depths, np.asarray(colors, dtype=np.uint8)))
+
+    def addPoints(self, points_2D, depths, radii, color):
+        """Queues points for the current frame, see splatPoints"""
+
+        if len(points_2D) > 0:
+            self.splats.append((points_2D, depths, radii, color))
+
+    def render(self, framebuffer, clear_color=None, background=None, regions=None):
+        """Clears the frame buffer and rasterizes everything queued since the last render, one tile per task
+
+        Parameters
+        ----------
+        framebuffer : FrameBuffer
+            The frame buffer
+        clear_color : tuple
+            The background color the tiles are cleared to
+        background : FrameBuffer
+            A frame buffer the tiles are restored from instead of being cleared
+        regions : list
+            The (x0, y0, x1, y1) rectangles to draw, only the tiles overlapping them are cleared and rasterized. The whole
+            buffer by default
+        """
+
+        width, height = framebuffer.resolution
+        tiles_x = -(-width // self.tile_size)
+        tiles_y = -(-height // self.tile_size)
+
+        # Bin the triangles, then each batch of points, by the tiles their bounding boxes overlap
+        triangle_bins = [[] for _ in range(tiles_x * tiles_y)]
+        if self.triangles:
+            triangles_2D = np.concatenate([triangles[0] for triangles in self.triangles])
+            triangle_depths = np.concatenate([triangles[1] for triangles in self.triangles])
+            triangle_colors = np.concatenate([triangles[2] for triangles in self.triangles])
+            triangle_bins = self.binBoxes(triangles_2D.min(axis=1), triangles_2D.max(axis=1), tiles_x, tiles_y)
+
+        splat_bins = []
+        for points_2D, depths, radii, color in self.splats:
+            extents = np.rint(radii)[:, np.newaxis] + 1
+            splat_bins.append(self.binBoxes(points_2D - extents, points_2D + extents, tiles_x, tiles_y))
+
+        tiles = np.arange(tiles_x * tiles_y)
+        if regions is not None:
+            regions = np.array(regions, dtype=float).reshape(-1, 4)
+            region_bins = self.binBoxes(regions[:, :2], regions[:, 2:] - 1, tiles_x, tiles_y)
+            tiles = np.flatnonzero([len(bins) > 0 for bins in region_bins])
+
+        def renderTile(tile):
+            tile_x, tile_y = divmod(tile, tiles_y)
+            region = (tile_x * self.tile_size, tile_y * self.tile_size,
+                      min((tile_x + 1) * self.tile_size, width), min((tile_y + 1) * self.tile_size, height))
+
+            if background is not None:
+                framebuffer.copyFrom(background, region)
+            else:
+                framebuffer.clear(clear_color, region)
+
+            selected = triangle_bins[tile]
+            if len(selected) > 0:
+                rasterTriangles(framebuffer, triangles_2D[selected], triangle_depths[selected], triangle_colors[selected],
+                                region)
+
+            for (points_2D, depths, radii, color), bins in zip(self.splats, splat_bins):
+                selected = bins[tile]
+                splatPoints(framebuffer, points_2D[selected], depths[selected], radii[selected], color, region)
+
+        try:
+            # Consuming the results raises the tasks' exceptions
+            list(self.executor.map(renderTile, tiles))
+        finally:
+            self.triangles = []
+            self.splats = []
+
+    def binBoxes(self, box_min, box_max, tiles_x, tiles_y):
+        """Returns, for every tile, the indices of the boxes overlapping it
+
+        Parameters
+        ----------
+        box_min : numpy.ndarray
+            An (N, 2) array of the boxes' lower corners, in pixels
+        box_max : numpy.ndarray
+            An (N, 2) array of the boxes' upper corners, in pixels
+        tiles_x : int
+            The number of tile columns
+        tiles_y : int
+            The number of tile rows
+
+        Returns
+        -------
+        list
+            One array of box indices per tile, tiles numbered tile_x * tiles_y + tile_y
+        """
+
+        first = np.clip(np.floor(box_min / self.tile_size), 0, [tiles_x - 1, tiles_y - 1]).astype(np.intp)
+        last = np.clip(np.floor(box_max / self.tile_size), 0, [tiles_x - 1, tiles_y - 1]).astype(np.intp)
+
+        # Boxes entirely off screen overlap no tile
+        on_screen = (box_max[:, 0] >= 0) & (box_max[:, 1] >= 0) \
+            & (box_min[:, 0] < tiles_x * self.tile_size) & (box_min[:, 1] < tiles_y * self.tile_size)
+        boxes = np.flatnonzero(on_screen)
+        first = first[boxes]
+        counts = last[boxes] - first + 1
+
+        # One (box, tile) pair per overlap: the box is repeated over its columns, then each column over its rows
+        pair_boxes = np.repeat(np.arange(len(boxes)), counts[:, 0] * counts[:, 1])
+        pair_starts = np.cumsum(counts[:, 0] * counts[:, 1]) - counts[:, 0] * counts[:, 1]
+        pair_ranks = np.arange(len(pair_boxes)) - pair_starts[pair_boxes]
+        pair_tiles = ((first[pair_boxes, 0] + pair_ranks // counts[pair_boxes, 1]) * tiles_y
+                      + first[pair_boxes, 1] + pair_ranks % counts[pair_boxes, 1])
+
+        order = np.argsort(pair_tiles, kind="stable")
+        bounds = np.searchsorted(pair_tiles[order], np.arange(tiles_x * tiles_y + 1))
+        pair_boxes = boxes[pair_boxes[order]]
+
+        return [pair_boxes[bounds[tile]:bounds[tile + 1]] for tile in range(tiles_x * tiles_y)]
+
+    def close(self):
+        """Stops the thread pool"""
+
+        self.executor.shutdown()
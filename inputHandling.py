@@ -2,43 +2,52 @@ import time
 import pygame
 import numpy as np
 
+import inputRecording
+
 # ----------------------------------------
 # Event and input handling
 # ----------------------------------------
 
 
-def handleInputs(render_class):
+def handleInputs(render_class, inputs=None):
     """Handles inputs and events
 
     Parameters
     ----------
     render_class : graphics.Rendering
         The rendering class responsible for rendering the simulation
+    inputs : inputRecording.InputFrame
+        The inputs of the frame, pygame's live state by default (a replayed frame feeds back recorded inputs)
     """
 
     step = 0.1
 
-    handleEvents(render_class)
-    debugHandler(render_class, step)
-    movementHandler(render_class, step)
-    rotationHandler(render_class)
+    if inputs is None:
+        inputs = inputRecording.InputFrame.live(0)
+
+    handleEvents(render_class, inputs.events)
+    debugHandler(render_class, step, inputs.keys)
+    movementHandler(render_class, step, inputs.keys)
+    rotationHandler(render_class, inputs.mouse_rel)
 
 
-def handleEvents(render_class):
+def handleEvents(render_class, events):
     """Handles events pygame events and key presses
 
     Parameters
     ----------
     render_class : graphics.Rendering
         The rendering class responsible for rendering the simulation
+    events : list
+        The pygame events of the frame
     """
 
-    for event in pygame.event.get():
+    for event in events:
         if event.type == pygame.QUIT:
             pygame.quit()  # A quit event does not warrant a plot. It is a request for immediate termination (When plotting is implemented)
             exit()
         if event.type == pygame.VIDEORESIZE:
-            render_class.updateVarsOnResize(render_class)
+            render_class.updateVarsOnResize()
 
         # Here we handle key presses (not key holds)
         if event.type == pygame.KEYDOWN:
@@ -59,7 +68,7 @@ def handleEvents(render_class):
                     pygame.event.set_grab(False)
 
 
-def movementHandler(render_class, step):
+def movementHandler(render_class, step, keys):
     """Handles movement of the camera
 
     Parameters
@@ -68,10 +77,10 @@ def movementHandler(render_class, step):
         The rendering class responsible for rendering the simulation
     step : float
         The step size of the movement
+    keys : object
+        The held keys, indexed by key constant like pygame.key.get_pressed()
     """
 
-    keys = pygame.key.get_pressed()
-
     # Save calculations by calculating only if needed
     if not (
             keys[pygame.K_s] or keys[pygame.K_z] or keys[pygame.K_q] or
@@ -111,21 +120,21 @@ def movementHandler(render_class, step):
         render_class.camera["position"][1] -= step
 
 
-def rotationHandler(render_class):
+def rotationHandler(render_class, mouse_move):
     """Handles rotation of the camera using the mouse
 
     Parameters
     ----------
     render_class : graphics.Rendering
         The rendering class responsible for rendering the simulation
+    mouse_move : tuple
+        The mouse movement since the last frame
     """
-
-    mouse_move = pygame.mouse.get_rel()
     render_class.camera["rotation"][0] -= mouse_move[1]/100
     render_class.camera["rotation"][1] -= mouse_move[0]/100
 
 
-def debugHandler(render_class, step):
+def debugHandler(render_class, step, keys):
     """Handles debug inputs and temporary debug features
 
     Parameters
@@ -134,10 +143,10 @@ def debugHandler(render_class, step):
         The rendering class responsible for rendering the simulation
     step : float
         The step size of the movement
+    keys : object
+        The held keys, indexed by key constant like pygame.key.get_pressed()
     """
 
-    keys = pygame.key.get_pressed()
-
     if keys[pygame.K_LEFT] or keys[pygame.K_RIGHT]:
         # Rotate camera on z axis
         if keys[pygame.K_LEFT]:
@@ -0,0 +1,235 @@
+import struct
+
+import numpy as np
+import pygame
+
+# ----------------------------------------
+# Input recording and replay
+# ----------------------------------------
+
+# Header: magic, version, seed of the initial state
+HEADER_FORMAT = "<8sIQ"
+MAGIC = b"3DEINPT\0"
+VERSION = 1
+
+# Frame: time step, pressed keys bitmask, mouse movement, event count, followed by the events (type, key)
+FRAME_FORMAT = "<dHhhB"
+EVENT_FORMAT = "<Ii"
+
+# The held keys read by the input handlers, one bit each in the bitmask
+RECORDED_KEYS = (pygame.K_s, pygame.K_z, pygame.K_q, pygame.K_d, pygame.K_e, pygame.K_a, pygame.K_LEFT, pygame.K_RIGHT)
+
+# The events handled by the input handlers
+RECORDED_EVENTS = (pygame.QUIT, pygame.VIDEORESIZE, pygame.KEYDOWN)
+
+
+def newSeed():
+    """Returns a fresh random seed for the initial state of a run
+
+    Returns
+    -------
+    int
+        The seed
+    """
+
+    return int(np.random.SeedSequence().entropy % (1 << 63))
+
+
+class PressedKeys:
+    """The held keys of a frame, indexed by key constant like pygame.key.get_pressed()
+
+    Parameters
+    ----------
+    mask : int
+        The bitmask of the held keys, in the order of RECORDED_KEYS
+    """
+
+    def __init__(self, mask):
+        self.mask = mask
+
+    def __getitem__(self, key):
+        if key not in RECORDED_KEYS:
+            return False
+        return bool(self.mask >> RECORDED_KEYS.index(key) & 1)
+
+    @staticmethod
+    def toMask(keys):
+        """Returns the bitmask of the recorded keys held in a pygame.key.get_pressed() state"""
+
+        return sum(1 << bit for bit, key in enumerate(RECORDED_KEYS) if keys[key])
+
+
+class InputFrame:
+    """The inputs of one frame, read by inputHandling.handleInputs in place of pygame's live state
+
+    Parameters
+    ----------
+    keys : object
+        The held keys, indexed by key constant
+    mouse_rel : tuple
+        The mouse movement since the last frame
+    events : list
+        The pygame events of the frame
+    dt : float
+        The time step the simulation is updated with during the frame
+    """
+
+    def __init__(self, keys, mouse_rel, events, dt):
+        self.keys = keys
+        self.mouse_rel = mouse_rel
+        self.events = events
+        self.dt = dt
+
+    @classmethod
+    def live(cls, dt):
+        """Reads the current keyboard, mouse and event state from pygame
+
+        Parameters
+        ----------
+        dt : float
+            The time step of the frame
+
+        Returns
+        -------
+        InputFrame
+            The inputs
+        """
+
+        return cls(pygame.key.get_pressed(), pygame.mouse.get_rel(), pygame.event.get(), dt)
+
+
+class LiveInputs:
+    """Provides the live inputs of every frame"""
+
+    def read(self, dt):
+        """Returns the inputs of the next frame
+
+        Parameters
+        ----------
+        dt : float
+            The time step of the frame
+
+        Returns
+        -------
+        InputFrame
+            The inputs
+        """
+
+        return InputFrame.live(dt)
+
+    def close(self):
+        pass
+
+
+class InputRecorder(LiveInputs):
+    """Provides the live inputs of every frame and appends them to a compact binary file, after the seed of the run's
+    initial state. Only the keys and events handled by inputHandling are stored.
+
+    Parameters
+    ----------
+    path : str
+        The path of the file
+    seed : int
+        The seed the run's initial state was generated with
+    """
+
+    def __init__(self, path, seed):
+        self.path = path
+        self.seed = seed
+        self.frame_count = 0
+
+        self.file = open(path, "wb")
+        self.file.write(struct.pack(HEADER_FORMAT, MAGIC, VERSION, seed))
+
+    def read(self, dt):
+        inputs = InputFrame.live(dt)
+
+        events = [event for event in inputs.events if event.type in RECORDED_EVENTS]
+        mouse_x, mouse_y = (max(min(int(delta), 32767), -32768) for delta in inputs.mouse_rel)
+
+        self.file.write(struct.pack(FRAME_FORMAT, dt, PressedKeys.toMask(inputs.keys), mouse_x, mouse_y, len(events)))
+        for event in events:
+            self.file.write(struct.pack(EVENT_FORMAT, event.type, getattr(event, "key", 0)))
+        self.frame_count += 1
+
+        return inputs
+
+    def close(self):
+        """Flushes and closes the file, once"""
+
+        if not self.file.closed:
+            self.file.close()
+            print(f"Recorded {self.frame_count} frames of inputs into {self.path}")
+
+
+class InputReplayer:
+    """Provides the inputs of every frame from a file written by InputRecorder. The live events are still read so that
+    the window stays responsive, and closing it still quits.
+
+    Parameters
+    ----------
+    path : str
+        The path of the file
+    """
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            data = f.read()
+
+        header_size = struct.calcsize(HEADER_FORMAT)
+        magic, version, self.seed = struct.unpack_from(HEADER_FORMAT, data)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not an input recording")
+        if version != VERSION:
+            raise ValueError(f"Unsupported input recording version {version}")
+
+        # Decode every frame at once, the file is small
+        self.frames = []
+        offset = header_size
+        frame_size = struct.calcsize(FRAME_FORMAT)
+        event_size = struct.calcsize(EVENT_FORMAT)
+        while offset + frame_size <= len(data):
+            dt, mask, mouse_x, mouse_y, nb_events = struct.unpack_from(FRAME_FORMAT, data, offset)
+            offset += frame_size
+
+            event_data = data[offset:offset + nb_events * event_size]
+            if len(event_data) < nb_events * event_size:
+                # The last frame of an interrupted recording
+                break
+            events = [pygame.event.Event(event_type, key=key)
+                      for event_type, key in struct.iter_unpack(EVENT_FORMAT, event_data)]
+            offset += len(event_data)
+
+            self.frames.append(InputFrame(PressedKeys(mask), (mouse_x, mouse_y), events, dt))
+
+        self.frame = 0
+
+    def __len__(self):
+        return len(self.frames)
+
+    def read(self, dt):
+        """Returns the inputs of the next recorded frame, whose time step replaces the measured one
+
+        Parameters
+        ----------
+        dt : float
+            The measured time step, unused
+
+        Returns
+        -------
+        InputFrame
+            The inputs, None once every frame was replayed
+        """
+
+        live_quit = [event for event in pygame.event.get() if event.type == pygame.QUIT]
+
+        if self.frame >= len(self.frames):
+            return None
+
+        inputs = self.frames[self.frame]
+        self.frame += 1
+
+        return InputFrame(inputs.keys, inputs.mouse_rel, inputs.events + live_quit, inputs.dt)
+
+    def close(self):
+        pass
@@ -2,11 +2,21 @@ import graphics_engine.graphics as graphics
 import simulation
 import inputHandling
 import profiling
+import parallel
+import simThread
+import trajectory
+import backends
+import renderFarm
+import qualityGovernor
+import inputRecording
 
 import args
 import numpy as np
 import pygame
 
+import atexit
+import os
+import tempfile
 import cProfile
 import pstats
 import time
@@ -16,19 +26,88 @@ def main():
     """The entry point of the program. It initialises the simulation and starts the simulation loop.
     """
 
+    # Retrieve arguments from the command line
+    runtime_arguments = args.init()
+
+    # Check a compute backend against the reference one
+    if runtime_arguments.check_backend:
+        backends.checkEquivalence(runtime_arguments.backend or "numpy")
+        print(f"Backend {runtime_arguments.backend or 'numpy'} agrees with the numpy reference")
+        return
+
+    # Batch rendering runs without opening a window
+    if runtime_arguments.render_frames is not None:
+        render_farm(runtime_arguments)
+        return
+
+    # Recording runs the simulation offline, without opening a window
+    if runtime_arguments.record is not None:
+        record_sim(init_simulation(runtime_arguments), runtime_arguments)
+        return
+
+    # Record or replay the inputs of every frame, a replayed recording also setting the seed
+    input_source = init_inputs(runtime_arguments)
+
     # Retrieve the initial variables
-    render_class, simulation_class, runtime_arguments, screen = init_sim()
+    render_class, simulation_class, runtime_arguments, screen = init_sim(runtime_arguments)
+
+    # Time every replayed frame, rather than the last few seconds
+    if isinstance(input_source, inputRecording.InputReplayer):
+        render_class.frame_timer = profiling.FrameTimer(size=max(len(input_source), 1))
 
     # Start the simulation loop
-    if runtime_arguments.profile_run == False:
-        loop_sim(render_class, simulation_class, screen)
+    if runtime_arguments.replay is not None:
+        loop_replay(render_class, trajectory.TrajectoryReader(runtime_arguments.replay), input_source)
+    elif runtime_arguments.profile_run == False:
+        if runtime_arguments.threaded_sim:
+            loop_threaded_sim(render_class, simulation_class, runtime_arguments, input_source)
+        else:
+            loop_sim(render_class, simulation_class, screen, runtime_arguments, input_source)
     else:
         profiling.start(runtime_arguments, screen)
 
+    # Only reached once a replay of the inputs is over
+    print_frame_timings(render_class.frame_timer)
+
 
-def init_sim():
+def init_inputs(runtime_arguments):
+    """Creates the source of the inputs of every frame: the live inputs, recorded into a file or not, or the frames of
+    a recording. The seed of the run is stored in recordings, and restored from them.
+
+    Parameters
+    ----------
+    runtime_arguments : argparse.Namespace
+        The command line arguments, whose seed is set when recording or replaying
+
+    Returns
+    -------
+    input_source : inputRecording.LiveInputs or inputRecording.InputReplayer
+        The source of the inputs
+    """
+
+    if runtime_arguments.replay_inputs is not None:
+        input_source = inputRecording.InputReplayer(runtime_arguments.replay_inputs)
+        runtime_arguments.seed = input_source.seed
+        return input_source
+
+    if runtime_arguments.record_inputs is not None:
+        if runtime_arguments.seed is None:
+            runtime_arguments.seed = inputRecording.newSeed()
+        input_source = inputRecording.InputRecorder(runtime_arguments.record_inputs, runtime_arguments.seed)
+        atexit.register(input_source.close)
+        return input_source
+
+    return inputRecording.LiveInputs()
+
+
+def init_sim(runtime_arguments=None):
     """Initialises the simulation and returns the initial variables.
 
+    Parameters
+    ----------
+    runtime_arguments : argparse.Namespace
+        The command line arguments, parsed here if not given
+
     Returns
     -------
     render_class : graphics.Rendering
@@ -40,21 +119,126 @@ def init_sim():
     """
 
     # Retrieve arguments from the command line
-    runtime_arguments = args.init()
+    if runtime_arguments is None:
+        runtime_arguments = args.init()
 
     screen = initPygame(runtime_arguments.resolution)
 
     # Initialise the render engine and the simulation
     render_class = graphics.Rendering(screen, runtime_arguments)
+    render_class.frame_timer = profiling.FrameTimer()
 
-    simulation_class = simulation.Simulation(gameObjects=[],
-                                             fluids=[simulation.addFluid(800, [0, 0, 0], [5, 10, 5])])
+    simulation_class = init_simulation(runtime_arguments)
 
     return render_class, simulation_class, runtime_arguments, screen
 
 
-def loop_sim(render_class, simulation_class, screen):
-    """The simulation loop. This is where the simulation is updated and rendered.
+def init_simulation(runtime_arguments):
+    """Creates the simulation described by the command line arguments.
+
+    Parameters
+    ----------
+    runtime_arguments : argparse.Namespace
+        The command line arguments
+
+    Returns
+    -------
+    simulation_class : simulation.Simulation
+        The simulation class
+    """
+
+    simulation_class = simulation.Simulation(gameObjects=[],
+                                             fluids=[simulation.addFluid(800, [0, 0, 0], [5, 10, 5],
+                                                                         runtime_arguments.neighbor_mode,
+                                                                         runtime_arguments.cutoff,
+                                                                         runtime_arguments.tile_size,
+                                                                         np.float32 if runtime_arguments.float32 else np.float64,
+                                                                         runtime_arguments.skin,
+                                                                         runtime_arguments.sleep_steps,
+                                                                         runtime_arguments.seed)],
+                                             batched=runtime_arguments.batched,
+                                             cross_interaction=runtime_arguments.cross_interaction,
+                                             cutoff=runtime_arguments.cutoff)
+
+    # Run the fluid step on the selected compute backend
+    if runtime_arguments.backend is not None:
+        backend = backends.getBackend(runtime_arguments.backend)
+        for fluid in simulation_class.fluids:
+            fluid.backend = backend
+
+    # Compute the particle interactions on a persistent pool of worker processes
+    if runtime_arguments.workers > 1:
+        worker_pool = parallel.FluidWorkerPool(runtime_arguments.workers, runtime_arguments.tile_size)
+        for fluid in simulation_class.fluids:
+            worker_pool.attach(fluid)
+        atexit.register(worker_pool.close)
+
+    return simulation_class
+
+
+def record_sim(simulation_class, runtime_arguments):
+    """Runs the simulation offline with a fixed time step of 1/fps, recording every step into a trajectory file.
+
+    Parameters
+    ----------
+    simulation_class : simulation.Simulation
+        The simulation to run
+    runtime_arguments : argparse.Namespace
+        The command line arguments
+    """
+
+    dt = 1 / runtime_arguments.fps
+    nb_frames = runtime_arguments.record_frames
+    fluids = simulation_class.fluids
+
+    # All the fluids are recorded as one set of particles, drawn inside the largest bounding box
+    writer = trajectory.TrajectoryWriter(runtime_arguments.record, nb_frames,
+                                         sum(len(fluid.p_positions) for fluid in fluids), dt,
+                                         np.max([fluid.size for fluid in fluids], axis=0),
+                                         fluids[0].p_positions.dtype, runtime_arguments.record_velocities)
+
+    for frame in range(nb_frames):
+        simulation_class.update(dt)
+
+        positions = np.concatenate([fluid.p_positions for fluid in fluids])
+        velocities = np.concatenate([fluid.p_velocities for fluid in fluids]) if runtime_arguments.record_velocities else None
+        writer.write(positions, velocities)
+
+        if (frame + 1) % 100 == 0:
+            print(f"Recorded {frame + 1}/{nb_frames} frames")
+
+    writer.close()
+
+    print(f"Finished recording {runtime_arguments.record}")
+
+
+def render_farm(runtime_arguments):
+    """Renders a run offscreen into image files: the replayed trajectory, or a simulation first recorded into a
+    temporary trajectory.
+
+    Parameters
+    ----------
+    runtime_arguments : argparse.Namespace
+        The command line arguments
+    """
+
+    if runtime_arguments.replay is not None:
+        renderFarm.renderTrajectory(runtime_arguments.replay, runtime_arguments)
+        return
+
+    handle, runtime_arguments.record = tempfile.mkstemp(suffix=".traj")
+    os.close(handle)
+    try:
+        record_sim(init_simulation(runtime_arguments), runtime_arguments)
+        renderFarm.renderTrajectory(runtime_arguments.record, runtime_arguments)
+    finally:
+        os.remove(runtime_arguments.record)
+
+
+def loop_sim(render_class, simulation_class, screen, runtime_arguments, input_source):
+    """The simulation loop. This is where the simulation is updated and rendered. Frames are paced to the target fps,
+    and the quality governor lowers the rendering quality and the simulation substeps when they run over budget. A
+    replayed recording also replaces the measured time steps, and ends the loop after its last frame.
 
     Parameters
     ----------
@@ -64,24 +248,148 @@ def loop_sim(render_class, simulation_class, screen):
         The simulation class responsible for updating the simulation
     screen : pygame.Surface
         The pygame screen on which the simulation is rendered
+    runtime_arguments : argparse.Namespace
+        The command line arguments
+    input_source : inputRecording.LiveInputs
+        The source of the inputs of every frame
     """
 
+    governor = qualityGovernor.QualityGovernor(runtime_arguments.fps, render_class, runtime_arguments.substeps,
+                                               runtime_arguments.adaptive_quality)
+    render_class.quality_governor = governor
+
     # Initialize dt with an arbitrary small value
     dt = 0.00001
     while True:
 
-        frame_start = time.time()
+        frame_start = time.perf_counter()
 
         # Handle input and events
-        inputHandling.handleInputs(render_class)
+        inputs = input_source.read(dt)
+        if inputs is None:
+            return
+        dt = inputs.dt
+        inputHandling.handleInputs(render_class, inputs)
+        input_end = time.perf_counter()
         # Display on screen
         render_class.draw(simulation_class)
+        render_end = time.perf_counter()
 
         # Update the simulation
-        for fluid in simulation_class.fluids:
-            fluid.update(dt)
+        substeps = governor.substeps
+        for _ in range(substeps):
+            simulation_class.update(dt / substeps, 1 / substeps)
+        frame_end = time.perf_counter()
+
+        render_class.frame_timer.record("input", input_end - frame_start)
+        render_class.frame_timer.record("render", render_end - input_end)
+        render_class.frame_timer.record("sim", frame_end - render_end)
+
+        # Wait for the end of the frame's budget, the next step covers the whole frame
+        dt = governor.endFrame()
+
+
+def loop_threaded_sim(render_class, simulation_class, runtime_arguments, input_source):
+    """The render loop used when the simulation runs on its own thread. The latest completed simulation step is drawn
+    every frame, without waiting for the step in progress. Frames are paced to the target fps, and the quality governor
+    lowers the rendering quality when they run over budget.
+
+    Parameters
+    ----------
+    render_class : graphics.Rendering
+        The rendering class responsible for rendering the simulation
+    simulation_class : simulation.Simulation
+        The simulation class, stepped by the simulation thread
+    runtime_arguments : argparse.Namespace
+        The command line arguments
+    input_source : inputRecording.LiveInputs
+        The source of the inputs of every frame, the replayed time steps are not used by the simulation thread
+    """
+
+    sim_thread = simThread.SimulationThread(simulation_class, runtime_arguments.tick_rate, render_class.frame_timer)
+    sim_thread.start()
+
+    # The simulation thread has its own tick rate, only the render knobs are governed
+    governor = qualityGovernor.QualityGovernor(runtime_arguments.fps, render_class, 1, runtime_arguments.adaptive_quality)
+    render_class.quality_governor = governor
+
+    frame_time = 0
+    while True:
+
+        frame_start = time.perf_counter()
+
+        # Handle input and events
+        inputs = input_source.read(frame_time)
+        if inputs is None:
+            sim_thread.stop()
+            return
+        inputHandling.handleInputs(render_class, inputs)
+        input_end = time.perf_counter()
+        # Display the latest snapshot on screen
+        render_class.draw(simulation_class, sim_thread.snapshots.latest())
+
+        render_class.frame_timer.record("input", input_end - frame_start)
+        render_class.frame_timer.record("render", time.perf_counter() - input_end)
+
+        frame_time = governor.endFrame()
+
+
+def loop_replay(render_class, reader, input_source):
+    """The replay loop. Frames are streamed from a recorded trajectory into the renderer, at the recorded time step,
+    without running the simulation. The replay loops back to the start after the last frame.
+
+    Parameters
+    ----------
+    render_class : graphics.Rendering
+        The rendering class responsible for rendering the replay
+    reader : trajectory.TrajectoryReader
+        The recorded trajectory
+    input_source : inputRecording.LiveInputs
+        The source of the inputs of every frame
+    """
+
+    # An empty fluid only provides the bounding box
+    replay_simulation = simulation.Simulation(gameObjects=[], fluids=[simulation.addFluid(0, [0, 0, 0], reader.size)])
+
+    frame = 0
+    next_frame_time = time.time()
+    while True:
+
+        frame_start = time.perf_counter()
+
+        # Handle input and events
+        inputs = input_source.read(reader.dt)
+        if inputs is None:
+            return
+        inputHandling.handleInputs(render_class, inputs)
+        input_end = time.perf_counter()
+        # Display the frame on screen
+        render_class.draw(replay_simulation, [reader.positions(frame)])
+
+        render_class.frame_timer.record("input", input_end - frame_start)
+        render_class.frame_timer.record("render", time.perf_counter() - input_end)
+
+        # Move on to the frame due at the current time
+        now = time.time()
+        while next_frame_time <= now:
+            frame = (frame + 1) % len(reader)
+            next_frame_time += reader.dt
+
+
+def print_frame_timings(frame_timer):
+    """Prints the min, average and 99th percentile durations of each timed stage of the loop.
+
+    Parameters
+    ----------
+    frame_timer : profiling.FrameTimer
+        The frame timer of the run
+    """
 
-        dt = time.time() - frame_start
+    print(f"Frame timings over {max(frame_timer.counts.values())} frames:")
+    for stage in frame_timer.stages:
+        stats = frame_timer.stats(stage)
+        if stats is not None:
+            print(f"  {stage}: min {stats[0]:.2f} ms / avg {stats[1]:.2f} ms / p99 {stats[2]:.2f} ms")
 
 
 def initPygame(resolution):
@@ -0,0 +1,206 @@
+import os
+import re
+import struct
+
+import numpy as np
+
+# ----------------------------------------
+# OBJ loading and binary mesh cache
+# ----------------------------------------
+
+# Cache header: magic, size and mtime of the source OBJ file, vertex count, triangle count
+CACHE_HEADER_FORMAT = "<8sQqQQ"
+CACHE_HEADER_SIZE = struct.calcsize(CACHE_HEADER_FORMAT)
+CACHE_MAGIC = b"3DEMESH\0"
+CACHE_EXTENSION = ".meshcache"
+
+
+def loadMesh(path):
+    """Loads the points and triangles of an OBJ file. The parsed mesh is cached in a binary file next to the OBJ file,
+    keyed by the OBJ's size and modification time, so later loads are a single memory-mapped read.
+
+    Parameters
+    ----------
+    path : str
+        The path of the OBJ file
+
+    Returns
+    -------
+    points : np.array
+        An (N, 3) array of points. Loaded from the cache, it is a read-only memory map: copy it before modifying the
+        points in place
+    faces : np.array
+        An (M, 3) array of triangles (1-based indices of their points), read-only as well when loaded from the cache
+    """
+
+    stat = os.stat(path)
+    cache_path = path + CACHE_EXTENSION
+
+    cached = readMeshCache(cache_path, stat.st_size, stat.st_mtime_ns)
+    if cached is not None:
+        return cached
+
+    with open(path, "r") as f:
+        points, faces = parseObj(f.read())
+
+    try:
+        writeMeshCache(cache_path, stat.st_size, stat.st_mtime_ns, points, faces)
+    except OSError:
+        # A read-only location only costs the cache
+        pass
+
+    return points, faces
+
+
+def parseObj(text):
+    """Parses the vertex ("v") and face ("f") records of an OBJ file. Polygons are triangulated as fans and negative
+    (relative) indices are resolved. The records are filtered once, then the values of all the records of a kind are
+    converted in a single np.fromstring call over their joined text.
+
+    Parameters
+    ----------
+    text : str
+        The content of the OBJ file
+
+    Returns
+    -------
+    points : np.array
+        An (N, 3) array of points
+    faces : np.array
+        An (M, 3) array of triangles (1-based indices of their points)
+    """
+
+    # Points: keep x, y, z when extra values (w, colors) are present
+    values, point_counts = parseRecords(re.findall(r"^v[ \t]+([^\n]*)", text, re.MULTILINE), float)
+    if len(point_counts) and np.all(point_counts == point_counts[0]):
+        points = values.reshape(len(point_counts), -1)[:, :3]
+    else:
+        starts = np.cumsum(point_counts) - point_counts
+        points = values[starts[:, np.newaxis] + np.arange(3)].reshape(-1, 3)
+
+    # Faces: keep the point index of each "v/vt/vn" corner
+    face_records = re.findall(r"^f[ \t]+([^\n]*)", text, re.MULTILINE)
+    corners, corner_counts = parseRecords(face_records, np.int64, strip_slashes=True)
+
+    # Negative indices are relative to the points defined before the face
+    if (corners < 0).any():
+        kinds = np.array([match.group(1) == "v" for match in re.finditer(r"^(v|f)[ \t]", text, re.MULTILINE)])
+        points_before = np.cumsum(kinds)[~kinds]
+        corner_points_before = np.repeat(points_before, corner_counts)
+        corners = np.where(corners < 0, corner_points_before + corners + 1, corners)
+
+    # Fan triangulation: a polygon of k corners gives the triangles (0, t + 1, t + 2) for t < k - 2
+    triangle_counts = np.maximum(corner_counts - 2, 0)
+    total = triangle_counts.sum()
+    owners = np.repeat(np.arange(len(face_records)), triangle_counts)
+    fan_offsets = np.arange(total) - np.repeat(np.cumsum(triangle_counts) - triangle_counts, triangle_counts)
+    starts = (np.cumsum(corner_counts) - corner_counts)[owners]
+
+    faces = np.stack((corners[starts], corners[starts + fan_offsets + 1], corners[starts + fan_offsets + 2]), axis=1)
+
+    return points, faces
+
+
+def parseRecords(records, dtype, strip_slashes=False):
+    """Converts the whitespace-separated values of many records in one call
+
+    Parameters
+    ----------
+    records : list
+        The records, as strings of values
+    dtype : np.dtype
+        The type of the values
+    strip_slashes : bool
+        Whether to drop everything from a "/" to the end of each value, e.g. the texture and normal indices of faces
+
+    Returns
+    -------
+    values : np.array
+        The values of all the records, one after the other
+    counts : np.array
+        The number of values of each record
+    """
+
+    characters = np.frombuffer("\n".join(records).encode(), dtype=np.uint8)
+    separators = np.isin(characters, np.frombuffer(b" \t\r\n", dtype=np.uint8))
+
+    if strip_slashes:
+        # Characters at or after the last slash that follows the last separator belong to a dropped part
+        positions = np.arange(len(characters))
+        last_slash = np.maximum.accumulate(np.where(characters == ord("/"), positions, -1))
+        last_separator = np.maximum.accumulate(np.where(separators, positions, -1))
+        kept = last_slash <= last_separator
+        characters = characters[kept]
+        separators = separators[kept]
+
+    # Each value starts with a character that follows a separator
+    starts = ~separators & np.concatenate(([True], separators[:-1]))
+    lines = np.cumsum(characters == ord("\n"))
+    counts = np.bincount(lines[starts], minlength=len(records))
+
+    text = characters.tobytes().decode()
+    values = np.fromstring(text, dtype=dtype, sep=" ") if counts.sum() else np.empty(0, dtype=dtype)
+
+    if counts.sum() != len(values):
+        raise ValueError("Malformed OBJ record")
+
+    return values, counts
+
+
+def readMeshCache(cache_path, source_size, source_mtime):
+    """Reads a mesh cache file with a single memory map, if it exists and matches the source file
+
+    Parameters
+    ----------
+    cache_path : str
+        The path of the cache file
+    source_size : int
+        The size of the source OBJ file
+    source_mtime : int
+        The modification time of the source OBJ file, in nanoseconds
+
+    Returns
+    -------
+    mesh : tuple
+        The points and faces, as read-only arrays mapped from the file, or None if the cache is missing or stale
+    """
+
+    if not os.path.exists(cache_path) or os.path.getsize(cache_path) < CACHE_HEADER_SIZE:
+        return None
+
+    data = np.memmap(cache_path, dtype=np.uint8, mode="r")
+    magic, size, mtime, nb_points, nb_faces = struct.unpack(CACHE_HEADER_FORMAT, data[:CACHE_HEADER_SIZE].tobytes())
+
+    if magic != CACHE_MAGIC or size != source_size or mtime != source_mtime:
+        return None
+    if len(data) != CACHE_HEADER_SIZE + (nb_points + nb_faces) * 3 * 8:
+        return None
+
+    points_end = CACHE_HEADER_SIZE + nb_points * 3 * 8
+    points = data[CACHE_HEADER_SIZE:points_end].view(np.float64).reshape(nb_points, 3)
+    faces = data[points_end:].view(np.int64).reshape(nb_faces, 3)
+
+    return points, faces
+
+
+def writeMeshCache(cache_path, source_size, source_mtime, points, faces):
+    """Writes a mesh cache file
+
+    Parameters
+    ----------
+    cache_path : str
+        The path of the cache file
+    source_size : int
+        The size of the source OBJ file
+    source_mtime : int
+        The modification time of the source OBJ file, in nanoseconds
+    points : np.array
+        An (N, 3) array of points
+    faces : np.array
+        An (M, 3) array of triangles
+    """
+
+    with open(cache_path, "wb") as f:
+        f.write(struct.pack(CACHE_HEADER_FORMAT, CACHE_MAGIC, source_size, source_mtime, len(points), len(faces)))
+        f.write(np.ascontiguousarray(points, dtype="<f8").tobytes())
+        f.write(np.ascontiguousarray(faces, dtype="<i8").tobytes())
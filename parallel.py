@@ -0,0 +1,186 @@
+import multiprocessing as mp
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+import simulation
+
+# ----------------------------------------
+# Multi-core force evaluation
+# ----------------------------------------
+
+
+class FluidWorkerPool:
+    """A persistent pool of worker processes computing particle interactions. The particle arrays of attached fluids are
+    moved into shared memory blocks so the workers read them without any copy, each worker computing the accelerations of
+    a disjoint range of rows. Workers are started once and reused for every step.
+
+    Parameters
+    ----------
+    nb_workers : int
+        The number of worker processes
+    tile_size : int
+        The number of rows a worker evaluates at once
+    """
+
+    def __init__(self, nb_workers, tile_size=256):
+        self.nb_workers = nb_workers
+        self.tile_size = tile_size
+
+        self.blocks = {}
+        self.accelerations = {}
+        self.fluids = {}
+        self.next_fluid_id = 0
+
+        self.connections = []
+        self.workers = []
+        for i in range(nb_workers):
+            parent_connection, worker_connection = mp.Pipe()
+            worker = mp.Process(target=_worker, args=(worker_connection, tile_size), daemon=True)
+            worker.start()
+            self.connections.append(parent_connection)
+            self.workers.append(worker)
+
+    def attach(self, fluid):
+        """Moves the fluid's particle arrays into shared memory and registers them with the workers
+
+        Parameters
+        ----------
+        fluid : simulation.Fluid
+            The fluid to attach
+        """
+
+        fluid_id = self.next_fluid_id
+        self.next_fluid_id += 1
+
+        nb_particles = len(fluid.p_positions)
+        dtype = fluid.p_positions.dtype
+        arrays = {
+            "positions": np.ascontiguousarray(fluid.p_positions, dtype=dtype),
+            "velocities": np.ascontiguousarray(fluid.p_velocities, dtype=dtype),
+            "masses": np.ascontiguousarray(fluid.p_masses, dtype=dtype),
+            "accelerations": np.zeros((nb_particles, 3), dtype=dtype),
+        }
+
+        blocks = {}
+        views = {}
+        for name, array in arrays.items():
+            block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            view = np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)
+            view[:] = array
+            blocks[name] = block
+            views[name] = view
+
+        self.blocks[fluid_id] = blocks
+        self.accelerations[fluid_id] = views["accelerations"]
+        self.fluids[fluid_id] = fluid
+
+        fluid.p_positions = views["positions"]
+        fluid.p_velocities = views["velocities"]
+        fluid.p_masses = views["masses"]
+        fluid.worker_pool = self
+        fluid.worker_pool_id = fluid_id
+
+        names = {name: block.name for name, block in blocks.items()}
+        for connection in self.connections:
+            connection.send(("attach", fluid_id, names, nb_particles, dtype.str))
+        for connection in self.connections:
+            connection.recv()
+
+    def computeAccelerations(self, fluid):
+        """Computes the accelerations of all the particles of an attached fluid, splitting the rows across the workers
+
+        Parameters
+        ----------
+        fluid : simulation.Fluid
+            The fluid, previously attached to this pool
+
+        Returns
+        -------
+        accelerations : np.array
+            An (N, 3) shared array holding the accelerations
+        """
+
+        fluid_id = fluid.worker_pool_id
+        nb_particles = len(fluid.p_positions)
+
+        bounds = np.linspace(0, nb_particles, self.nb_workers + 1).astype(int)
+        for connection, start, end in zip(self.connections, bounds[:-1], bounds[1:]):
+            connection.send(("step", fluid_id, int(start), int(end)))
+        for connection in self.connections:
+            connection.recv()
+
+        return self.accelerations[fluid_id]
+
+    def close(self):
+        """Stops the workers and releases the shared memory blocks. Attached fluids keep a private copy of their arrays.
+        """
+
+        for connection in self.connections:
+            connection.send(("close",))
+        for worker in self.workers:
+            worker.join()
+
+        self.connections = []
+        self.workers = []
+
+        # Give the fluids private copies so no view into the blocks survives them
+        for fluid in self.fluids.values():
+            fluid.p_positions = fluid.p_positions.copy()
+            fluid.p_velocities = fluid.p_velocities.copy()
+            fluid.p_masses = fluid.p_masses.copy()
+            fluid.worker_pool = None
+        self.fluids = {}
+        self.accelerations = {}
+
+        for blocks in self.blocks.values():
+            for block in blocks.values():
+                block.close()
+                block.unlink()
+
+        self.blocks = {}
+
+
+def _worker(connection, tile_size):
+    """The loop run by each worker process. Waits for commands from the pool until asked to close.
+
+    Parameters
+    ----------
+    connection : multiprocessing.connection.Connection
+        The worker's end of the pipe to the pool
+    tile_size : int
+        The number of rows evaluated at once
+    """
+
+    blocks = []
+    fluids = {}
+
+    while True:
+        message = connection.recv()
+
+        if message[0] == "attach":
+            _, fluid_id, names, nb_particles, dtype = message
+            views = {}
+            for name, block_name in names.items():
+                block = shared_memory.SharedMemory(name=block_name)
+                # The pool owns the block, don't let this process' resource tracker unlink it on exit
+                resource_tracker.unregister(block._name, "shared_memory")
+                blocks.append(block)
+                shape = (nb_particles,) if name == "masses" else (nb_particles, 3)
+                views[name] = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+            fluids[fluid_id] = views
+            connection.send(True)
+
+        elif message[0] == "step":
+            _, fluid_id, start, end = message
+            views = fluids[fluid_id]
+            simulation.rowAccelerations(views["positions"], views["masses"], start, end, tile_size,
+                                        views["accelerations"][start:end])
+            connection.send(True)
+
+        elif message[0] == "close":
+            fluids = {}
+            views = {}
+            for block in blocks:
+                block.close()
+            break
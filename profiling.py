@@ -8,6 +8,66 @@ import graphics_engine.graphics as graphics
 import simulation
 
 
+# ----------------------------------------
+# Live frame timings
+# ----------------------------------------
+
+
+class FrameTimer:
+    """Keeps the durations of the last frames of each stage of the loop in ring buffers, and summarizes them for the
+    overlay. Each stage has its own buffer, so stages timed on another thread (the threaded simulation) are recorded
+    without coordinating with the render loop.
+
+    Parameters
+    ----------
+    stages : tuple
+        The names of the timed stages
+    size : int
+        The number of frames kept per stage
+    """
+
+    def __init__(self, stages=("input", "render", "sim"), size=240):
+        self.stages = stages
+        self.durations = {stage: np.zeros(size) for stage in stages}
+        self.counts = {stage: 0 for stage in stages}
+
+    def record(self, stage, seconds):
+        """Records the duration of a stage for the current frame
+
+        Parameters
+        ----------
+        stage : str
+            The name of the stage
+        seconds : float
+            The duration, in seconds
+        """
+
+        durations = self.durations[stage]
+        durations[self.counts[stage] % len(durations)] = seconds
+        self.counts[stage] += 1
+
+    def stats(self, stage):
+        """Returns the min, average and 99th percentile durations of a stage over the buffered frames, in milliseconds
+
+        Parameters
+        ----------
+        stage : str
+            The name of the stage
+
+        Returns
+        -------
+        tuple
+            (min, avg, p99), None if the stage was never recorded
+        """
+
+        count = min(self.counts[stage], len(self.durations[stage]))
+        if count == 0:
+            return None
+
+        durations = self.durations[stage][:count] * 1000
+        return durations.min(), durations.mean(), np.percentile(durations, 99)
+
+
 def start(runtime_arguments, screen):
     """The profiling function.
 
@@ -57,8 +117,7 @@ def start(runtime_arguments, screen):
 
             update_time = time.time()
             # Update the simulation
-            for fluid in simulation_class.fluids:
-                fluid.update(dt)
+            simulation_class.update(dt)
 
             dt = time.time() - frame_start
 
@@ -0,0 +1,138 @@
+import time
+
+# ----------------------------------------
+# Frame pacing and adaptive quality
+# ----------------------------------------
+
+# Quality levels, from full quality to the cheapest frames: the fraction of the window resolution rendered internally,
+# the scale of the particles' size, the scale of the particle count from which the density image is drawn, and the
+# fraction of the configured simulation substeps
+QUALITY_LEVELS = [
+    {"render_scale": 1.0, "particle_scale": 1.0, "lod_scale": 1.0, "substep_scale": 1.0},
+    {"render_scale": 1.0, "particle_scale": 0.75, "lod_scale": 1.0, "substep_scale": 0.5},
+    {"render_scale": 0.75, "particle_scale": 0.75, "lod_scale": 0.5, "substep_scale": 0.5},
+    {"render_scale": 0.75, "particle_scale": 0.5, "lod_scale": 0.25, "substep_scale": 0},
+    {"render_scale": 0.5, "particle_scale": 0.5, "lod_scale": 0.1, "substep_scale": 0},
+]
+
+
+class QualityGovernor:
+    """Paces the main loop to the target frame rate and trades quality for speed when frames run over budget. The time
+    spent working on each frame is smoothed; when it stays over the budget, the quality level is lowered one step, and
+    when it stays well under, it is raised back. Changes are spaced out so that the effect of one is measured before
+    the next.
+
+    Parameters
+    ----------
+    target_fps : float
+        The target frame rate
+    render_class : graphics.Rendering
+        The renderer whose render scale, particle scale and LOD scale are set
+    max_substeps : int
+        The number of simulation steps per frame at full quality
+    enabled : bool
+        Whether the quality is adapted, otherwise the loop is only paced
+    """
+
+    def __init__(self, target_fps, render_class, max_substeps=1, enabled=True):
+        self.budget = 1 / target_fps if target_fps > 0 else 0
+        self.render_class = render_class
+        self.max_substeps = max_substeps
+        self.enabled = enabled
+
+        self.level = 0
+        self.work_time = 0
+        self.frames_since_change = 0
+        self.frames_since_scale_change = 0
+        self.frame_start = time.perf_counter()
+
+        self.applyLevel()
+
+    @property
+    def substeps(self):
+        """The number of simulation steps per frame at the current quality level"""
+
+        return max(1, round(self.max_substeps * QUALITY_LEVELS[self.level]["substep_scale"]))
+
+    def endFrame(self):
+        """Records the work done for the frame, adapts the quality, then waits for the end of the frame's time budget
+
+        Returns
+        -------
+        float
+            The duration of the frame, waiting included, in seconds
+        """
+
+        now = time.perf_counter()
+        work_time = now - self.frame_start
+
+        if self.enabled and self.budget > 0:
+            self.adapt(work_time)
+
+        # Wait for the end of the budget, frames over budget are not caught up on
+        if self.budget > 0 and work_time < self.budget:
+            time.sleep(self.budget - work_time)
+            now = time.perf_counter()
+
+        frame_time = now - self.frame_start
+        self.frame_start = now
+
+        return frame_time
+
+    def adapt(self, work_time):
+        """Updates the smoothed work time and moves the quality level when it stays out of bounds
+
+        Parameters
+        ----------
+        work_time : float
+            The time spent working on the last frame, in seconds
+        """
+
+        self.work_time = work_time if self.work_time == 0 else 0.9 * self.work_time + 0.1 * work_time
+        self.frames_since_change += 1
+        self.frames_since_scale_change += 1
+
+        # Lowering the quality reacts faster than raising it back, so that a level which fits is kept
+        if self.work_time > self.budget and self.frames_since_change >= 15 and self.level < len(QUALITY_LEVELS) - 1:
+            level = self.level + 1
+        elif self.work_time < 0.6 * self.budget and self.frames_since_change >= 60 and self.level > 0:
+            level = self.level - 1
+        else:
+            return
+
+        # A new render scale renders the static layer again at the new resolution, so it is changed at most every
+        # 2 seconds
+        if QUALITY_LEVELS[level]["render_scale"] != QUALITY_LEVELS[self.level]["render_scale"]:
+            if self.frames_since_scale_change < 2 / self.budget:
+                return
+            self.frames_since_scale_change = 0
+
+        self.level = level
+        self.frames_since_change = 0
+        self.applyLevel()
+
+    def applyLevel(self):
+        """Applies the render knobs of the current quality level to the renderer"""
+
+        knobs = QUALITY_LEVELS[self.level]
+        self.render_class.render_scale = knobs["render_scale"]
+        self.render_class.particle_scale = knobs["particle_scale"]
+        self.render_class.lod_scale = knobs["lod_scale"]
+
+    def describe(self):
+        """Returns the overlay lines describing the current decisions
+
+        Returns
+        -------
+        list
+            The lines
+        """
+
+        knobs = QUALITY_LEVELS[self.level]
+        target = f"{1 / self.budget:.0f} fps" if self.budget > 0 else "unpaced"
+
+        return [
+            f"Quality: level {self.level}/{len(QUALITY_LEVELS) - 1} (target {target}, work {self.work_time * 1000:.1f} ms)",
+            f"Render scale {knobs['render_scale']:.2f} / particles {knobs['particle_scale']:.2f} / "
+            f"LOD x{knobs['lod_scale']:.2f} / substeps {self.substeps}",
+        ]
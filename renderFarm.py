@@ -0,0 +1,213 @@
+import os
+import json
+import queue
+import threading
+import multiprocessing
+import concurrent.futures
+
+import numpy as np
+import pygame
+
+import simulation
+import trajectory
+
+# ----------------------------------------
+# Headless batch rendering
+# ----------------------------------------
+
+
+def loadCameraPath(path):
+    """Loads a camera path: a JSON file holding a list of keyframes, each with a frame index and the camera's position,
+    rotation (in radians) and optionally fov, e.g. {"keyframes": [{"frame": 0, "position": [0, 5, -5],
+    "rotation": [0, 0, 0], "fov": 90}, ...]}
+
+    Parameters
+    ----------
+    path : str
+        The path of the file, None for a still camera
+
+    Returns
+    -------
+    list
+        The keyframes, sorted by frame
+    """
+
+    if path is None:
+        return []
+
+    with open(path) as f:
+        keyframes = json.load(f)["keyframes"]
+
+    return sorted(keyframes, key=lambda keyframe: keyframe["frame"])
+
+
+def cameraAt(keyframes, frame, camera):
+    """Sets the camera to its state at a frame, interpolated linearly between the surrounding keyframes and held before
+    the first and after the last
+
+    Parameters
+    ----------
+    keyframes : list
+        The keyframes of the camera path
+    frame : int
+        The frame index
+    camera : dict
+        The camera of the Rendering class, modified in place
+    """
+
+    if not keyframes:
+        return
+
+    frames = [keyframe["frame"] for keyframe in keyframes]
+    after = int(np.searchsorted(frames, frame, side="right"))
+    before = keyframes[max(after - 1, 0)]
+    after = keyframes[min(after, len(keyframes) - 1)]
+
+    span = after["frame"] - before["frame"]
+    t = 0 if span == 0 else min(max((frame - before["frame"]) / span, 0), 1)
+
+    for key in ("position", "rotation"):
+        camera[key] = (1 - t) * np.array(before[key], dtype=float) + t * np.array(after[key], dtype=float)
+    if "fov" in before:
+        camera["fov"] = (1 - t) * before["fov"] + t * after.get("fov", before["fov"])
+
+
+def renderTrajectory(trajectory_path, runtime_arguments):
+    """Renders every frame of a recorded trajectory offscreen, following the camera path, into PNG files or a raw frame
+    stream. The frames are split into contiguous chunks rendered by a pool of processes.
+
+    Parameters
+    ----------
+    trajectory_path : str
+        The path of the trajectory file
+    runtime_arguments : argparse.Namespace
+        The command line arguments: render_frames is the output, a directory of PNG files, or a .npy file receiving
+        the frames as one (frames, height, width, 3) uint8 array
+    """
+
+    nb_frames = len(trajectory.TrajectoryReader(trajectory_path))
+    output = runtime_arguments.render_frames
+    nb_workers = runtime_arguments.render_workers or os.cpu_count()
+
+    # The raw stream is created once, the workers write their frames into it
+    if output.endswith(".npy"):
+        width, height = runtime_arguments.resolution
+        np.lib.format.open_memmap(output, mode="w+", dtype=np.uint8, shape=(nb_frames, height, width, 3)).flush()
+    else:
+        os.makedirs(output, exist_ok=True)
+
+    chunks = [chunk for chunk in np.array_split(np.arange(nb_frames), nb_workers) if len(chunk) > 0]
+    tasks = [(trajectory_path, runtime_arguments, chunk[0], chunk[-1] + 1) for chunk in chunks]
+
+    if len(tasks) <= 1:
+        for task in tasks:
+            renderChunk(task)
+    else:
+        # Fresh interpreters, rather than forks of a process whose thread pools (BLAS, SDL) may hold locks
+        with concurrent.futures.ProcessPoolExecutor(len(tasks), mp_context=multiprocessing.get_context("spawn")) as pool:
+            list(pool.map(renderChunk, tasks))
+
+    print(f"Rendered {nb_frames} frames into {output}")
+
+
+def renderChunk(task):
+    """Renders the frames [start, end) of a trajectory offscreen. Runs in a worker process.
+
+    Parameters
+    ----------
+    task : tuple
+        (trajectory_path, runtime_arguments, start, end)
+    """
+
+    trajectory_path, runtime_arguments, start, end = task
+
+    # Render into a plain surface, without a window
+    os.environ["SDL_VIDEODRIVER"] = "dummy"
+    pygame.init()
+
+    import graphics_engine.graphics as graphics
+
+    reader = trajectory.TrajectoryReader(trajectory_path)
+    keyframes = loadCameraPath(runtime_arguments.camera_path)
+
+    screen = pygame.Surface(runtime_arguments.resolution)
+    render_class = graphics.Rendering(screen, runtime_arguments)
+
+    # An empty fluid only provides the bounding box
+    render_simulation = simulation.Simulation(gameObjects=[], fluids=[simulation.addFluid(0, [0, 0, 0], reader.size)])
+
+    output = runtime_arguments.render_frames
+    writer = None
+    if output.endswith(".npy"):
+        frames = np.load(output, mmap_mode="r+")
+    else:
+        writer = FrameWriter()
+
+    for frame in range(start, end):
+        cameraAt(keyframes, frame, render_class.camera)
+        render_class.draw(render_simulation, [reader.positions(frame)], present=False)
+
+        if writer is not None:
+            # The writer encodes a copy while the next frame renders
+            writer.write(screen.copy(), os.path.join(output, f"frame_{frame:06d}.png"))
+        else:
+            frames[frame] = pygame.surfarray.pixels3d(screen).transpose(1, 0, 2)
+
+    if writer is not None:
+        writer.close()
+    else:
+        frames.flush()
+
+    print(f"Rendered frames {start} to {end - 1}")
+
+
+class FrameWriter:
+    """Saves rendered surfaces as PNG files on a background thread, so that encoding overlaps with rendering. The queue
+    is bounded, rendering waits for the writer when it is too far ahead.
+
+    Parameters
+    ----------
+    max_pending : int
+        The maximum number of frames waiting to be written
+    """
+
+    def __init__(self, max_pending=8):
+        self.queue = queue.Queue(max_pending)
+        self.error = None
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+
+            surface, path = item
+            try:
+                pygame.image.save(surface, path)
+            except Exception as error:
+                self.error = error
+
+    def write(self, surface, path):
+        """Queues a surface to be saved
+
+        Parameters
+        ----------
+        surface : pygame.Surface
+            The surface, which must not be modified afterwards
+        path : str
+            The path of the PNG file
+        """
+
+        if self.error is not None:
+            raise self.error
+        self.queue.put((surface, path))
+
+    def close(self):
+        """Waits for the pending frames to be written"""
+
+        self.queue.put(None)
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
@@ -0,0 +1,110 @@
+import threading
+import time
+
+import numpy as np
+
+# ----------------------------------------
+# Simulation running on its own thread
+# ----------------------------------------
+
+
+class SnapshotBuffer:
+    """A triple buffer of particle positions. The writer fills the back buffer and publishes it, the reader always gets the
+    latest published snapshot. Neither side ever waits for the other to finish its work.
+
+    Parameters
+    ----------
+    fluids : list
+        The fluids whose positions are buffered
+    """
+
+    def __init__(self, fluids):
+        self.lock = threading.Lock()
+        self.buffers = [[np.array(fluid.p_positions) for fluid in fluids] for i in range(3)]
+
+        # Indices of the buffers owned by the reader, shared between both sides, and owned by the writer
+        self.front = 0
+        self.middle = 1
+        self.back = 2
+        self.fresh = False
+        self.published_count = 0
+
+    def publish(self, fluids):
+        """Copies the fluids' positions into the back buffer and makes it the latest snapshot
+
+        Parameters
+        ----------
+        fluids : list
+            The fluids to copy the positions from
+        """
+
+        back = self.buffers[self.back]
+        for i, fluid in enumerate(fluids):
+            if back[i].shape != fluid.p_positions.shape:
+                back[i] = np.empty_like(fluid.p_positions)
+            np.copyto(back[i], fluid.p_positions)
+
+        with self.lock:
+            self.back, self.middle = self.middle, self.back
+            self.fresh = True
+            self.published_count += 1
+
+    def latest(self):
+        """Returns the latest published snapshot. The arrays stay valid until the next call.
+
+        Returns
+        -------
+        positions : list
+            One (N, 3) array of positions per fluid
+        """
+
+        with self.lock:
+            if self.fresh:
+                self.front, self.middle = self.middle, self.front
+                self.fresh = False
+
+        return self.buffers[self.front]
+
+
+class SimulationThread(threading.Thread):
+    """Steps a simulation at a fixed tick rate on its own thread, publishing each completed step into a snapshot buffer.
+    NumPy releases the GIL inside large array operations, so the simulation overlaps with the rendering.
+
+    Parameters
+    ----------
+    simulation : simulation.Simulation
+        The simulation to step
+    tick_rate : float
+        The number of steps per second
+    frame_timer : profiling.FrameTimer
+        Records the duration of each step as the "sim" stage, if given
+    """
+
+    def __init__(self, simulation, tick_rate, frame_timer=None):
+        super().__init__(daemon=True)
+
+        self.simulation = simulation
+        self.dt = 1 / tick_rate
+        self.frame_timer = frame_timer
+        self.snapshots = SnapshotBuffer(simulation.fluids)
+        self.running = True
+
+    def run(self):
+        next_tick = time.perf_counter()
+
+        while self.running:
+            step_start = time.perf_counter()
+            self.simulation.update(self.dt)
+            self.snapshots.publish(self.simulation.fluids)
+            if self.frame_timer is not None:
+                self.frame_timer.record("sim", time.perf_counter() - step_start)
+
+            # Wait for the next tick. A slow step is not caught up on, the simulation simply runs slower
+            next_tick = max(next_tick + self.dt, time.perf_counter())
+            time.sleep(max(0, next_tick - time.perf_counter()))
+
+    def stop(self):
+        """Asks the thread to stop after its current step and waits for it"""
+
+        self.running = False
+        self.join()
@@ -1,6 +1,8 @@
 import numpy as np
 import time
 
+import meshLoader
+
 
 class Simulation:
     """A simulation is a collection of GameObjects and Fluids
@@ -9,27 +11,614 @@ class Simulation:
     ----------
     gameObjects : list
         A list of GameObjects
+    fluids : list
+        A list of Fluids
+    batched : bool
+        Whether all the fluids are packed into one particle array and stepped together
+    cross_interaction : bool
+        Whether particles of different fluids interact, in batched mode
+    cutoff : float
+        The interaction range of the cell list used in batched mode
     """
 
-    def __init__(self, gameObjects=[], fluids=[]):
+    def __init__(self, gameObjects=[], fluids=[], batched=False, cross_interaction=False, cutoff=1.0):
         self.gameObjects = gameObjects
         self.fluids = fluids
 
+        self.batched = batched
+        self.cross_interaction = cross_interaction
+        self.cutoff = cutoff
+        self.batch = None
+
+    def update(self, dt, step_fraction=1.0):
+        """Updates every fluid of the simulation
+
+        Parameters
+        ----------
+        dt : float
+            The time step
+        step_fraction : float
+            The fraction of the frame covered by the step. The velocity changes are scaled by it and the damping raised
+            to it, so that the dynamics of a frame don't depend on the number of steps it is split into
+        """
+
+        if self.batched:
+            if self.batch is None or not self.batch.matches(self.fluids):
+                self.batch = FluidBatch(self.fluids)
+            self.batch.update(dt, self.cutoff, self.cross_interaction, step_fraction)
+            return
+
+        for fluid in self.fluids:
+            fluid.update(dt, step_fraction)
+
+
+class FluidBatch:
+    """All the particles of several fluids packed into one contiguous particle store, with a per-particle fluid id and
+    per-fluid parameter tables, so that a single vectorized step updates every fluid. The fluids' particle arrays become
+    views into the packed arrays, so they keep being read (e.g. by the renderer) as usual.
+
+    Parameters
+    ----------
+    fluids : list
+        The fluids to pack
+    """
+
+    def __init__(self, fluids):
+        dtype = np.result_type(*[fluid.p_positions.dtype for fluid in fluids]) if fluids else np.float64
+
+        self.particles = ParticleStore(
+            np.concatenate([fluid.p_positions for fluid in fluids]) if fluids else np.empty((0, 3)),
+            np.concatenate([fluid.p_velocities for fluid in fluids]) if fluids else np.empty((0, 3)),
+            np.concatenate([fluid.p_masses for fluid in fluids]) if fluids else np.empty(0),
+            dtype)
+
+        counts = [len(fluid.p_positions) for fluid in fluids]
+        self.offsets = np.concatenate(([0], np.cumsum(counts))).astype(int)
+        self.fluid_ids = np.repeat(np.arange(len(fluids)), counts)
+
+        # Per-fluid parameter tables
+        self.sizes = np.array([fluid.size for fluid in fluids], dtype=dtype).reshape(-1, 3)
+        self.origins = np.array([fluid.position for fluid in fluids], dtype=dtype).reshape(-1, 3)
+        self.gravities = np.array([fluid.gravity for fluid in fluids], dtype=dtype)
+        self.dampings = np.array([fluid.damping for fluid in fluids], dtype=dtype)
+        self.fountain_radii = np.array([min(fluid.size[[0, 2]]) / 5 for fluid in fluids], dtype=dtype)
+
+        for fluid, start, end in zip(fluids, self.offsets[:-1], self.offsets[1:]):
+            fluid.p_positions = self.particles.positions[start:end]
+            fluid.p_velocities = self.particles.velocities[start:end]
+            fluid.p_masses = self.particles.masses[start:end]
+
+        self.fluids = list(fluids)
+        self.views = [(fluid.p_positions, fluid.p_velocities, fluid.p_masses) for fluid in fluids]
+
+    def matches(self, fluids):
+        """Checks whether the batch still packs exactly these fluids, with their arrays still bound to it
+
+        Parameters
+        ----------
+        fluids : list
+            The fluids of the simulation
+
+        Returns
+        -------
+        bool
+            False if the batch must be rebuilt
+        """
+
+        if len(fluids) != len(self.fluids):
+            return False
+
+        for fluid, packed_fluid, views in zip(fluids, self.fluids, self.views):
+            if fluid is not packed_fluid or fluid.p_positions is not views[0] or fluid.p_velocities is not views[1] \
+                    or fluid.p_masses is not views[2]:
+                return False
+
+        return True
+
+    def update(self, dt, cutoff, cross_interaction, step_fraction=1.0):
+        """Updates every packed fluid at once, with the same physics as Fluid.update
+
+        Parameters
+        ----------
+        dt : float
+            The time step
+        cutoff : float
+            The interaction range of the cell list
+        cross_interaction : bool
+            Whether particles of different fluids interact
+        step_fraction : float
+            The fraction of the frame covered by the step. The velocity changes are scaled by it and the damping raised
+            to it, so that the dynamics of a frame don't depend on the number of steps it is split into
+        """
+
+        positions = self.particles.positions
+        velocities = self.particles.velocities
+        fluid_ids = self.fluid_ids
+        sizes = self.sizes[fluid_ids]
+
+        # Interactions, in world space. Without cross interactions, the fluids are spread apart along x so that the cell
+        # list never pairs particles of different fluids
+        if cross_interaction:
+            world_positions = positions + self.origins[fluid_ids]
+        else:
+            spacing = self.sizes[:, 0].max(initial=0) + 2 * cutoff
+            world_positions = positions.copy()
+            world_positions[:, 0] += fluid_ids * spacing
+
+        pairs_i, pairs_j = buildCellPairs(world_positions, cutoff)
+        accelerations = pairAccelerations(world_positions, self.particles.masses, pairs_i, pairs_j, cutoff)
+        accelerations *= step_fraction
+        velocities += accelerations
+
+        # Gravity
+        velocities[:, 1] -= self.gravities[fluid_ids] * step_fraction
+
+        # Simulating a fountain in the center of each fluid
+        centers = sizes / 2
+        distances = (positions[:, 0] - centers[:, 0]) ** 2 + (positions[:, 2] - centers[:, 2]) ** 2
+        velocities[:, 1] += np.where(distances < self.fountain_radii[fluid_ids] ** 2, 0.2 * step_fraction, 0)
+
+        pos_test = positions + velocities * dt
+
+        # Collision with the walls
+        bounds_collision = (pos_test <= 0) | (pos_test >= sizes)
+        velocities[bounds_collision] *= -1 * (0.5)
+
+        np.clip(pos_test, 0, sizes, out=pos_test)
+
+        # Global damping
+        velocities *= (self.dampings ** step_fraction)[fluid_ids][:, np.newaxis]
+
+        np.copyto(positions, pos_test)
+
+
+def pointBounds(points):
+    """Returns the bounding volumes of a set of points
+
+    Parameters
+    ----------
+    points : np.array
+        An (N, 3) array of points
+
+    Returns
+    -------
+    aabb : np.array
+        The (2, 3) lower and upper corners of the axis-aligned box around the points
+    bounding_sphere : tuple
+        The center and radius of a sphere around the points, centered on the box
+    """
+
+    points = np.asarray(points, dtype=float).reshape(-1, 3)
+    if len(points) == 0:
+        return np.zeros((2, 3)), (np.zeros(3), 0.0)
+
+    aabb = np.array([points.min(axis=0), points.max(axis=0)])
+    center = aabb.mean(axis=0)
+
+    return aabb, (center, np.sqrt(((points - center) ** 2).sum(axis=1).max()))
+
+
+def rotationMatrix(rotation):
+    """Returns the rotation matrix of Euler angles, applied as Rot_x * Rot_y * Rot_z like the camera's
+
+    Parameters
+    ----------
+    rotation : np.array
+        The angles around the x, y and z axes, in radians
+
+    Returns
+    -------
+    np.array
+        The 3x3 rotation matrix
+    """
+
+    cos_x, cos_y, cos_z = np.cos(rotation)
+    sin_x, sin_y, sin_z = np.sin(rotation)
+
+    Rot_x = np.array([[1, 0, 0], [0, cos_x, -sin_x], [0, sin_x, cos_x]])
+    Rot_y = np.array([[cos_y, 0, sin_y], [0, 1, 0], [-sin_y, 0, cos_y]])
+    Rot_z = np.array([[cos_z, -sin_z, 0], [sin_z, cos_z, 0], [0, 0, 1]])
+
+    return Rot_x @ Rot_y @ Rot_z
+
 
 class GameObject:
-    """A game object is a collection of points and faces
+    """A game object is a collection of points and faces, placed in the world by a position, a rotation and a scale.
+    The world-space points are computed on first use and cached until the transform or the points change.
 
     Parameters
     ----------
     points : np.array
-        An array of points
+        An array of points, in the object's own space
     faces : np.array
         An array of faces (the indices of the points that make up the face)
+    position : np.array
+        The position of the object's origin in the world
+    rotation : np.array
+        The Euler angles of the object around the x, y and z axes, in radians
+    scale : float or np.array
+        The scale of the object, uniform or along each axis
+    """
+
+    def __init__(self, points, faces, position=(0, 0, 0), rotation=(0, 0, 0), scale=1):
+        self._points = points
+        self._faces = faces
+
+        self._position = self.freezeVector(position)
+        self._rotation = self.freezeVector(rotation)
+        self._scale = self.freezeVector(np.broadcast_to(scale, 3))
+
+        # Incremented on every change of the transform or the points, so that cached renderings can tell
+        self.version = 0
+
+        # World-space points, model matrix, bounding volumes and render buffers, computed on first use
+        self.dirty = True
+        self._world_points = None
+        self._model_matrix = None
+        self._aabb = None
+        self._bounding_sphere = None
+        self._vertex_colors = None
+        self._edges = None
+
+    @staticmethod
+    def freezeVector(vector):
+        """Returns a read-only copy of a 3D vector, so that editing it in place fails rather than skipping the dirty
+        flag"""
+
+        vector = np.array(vector, dtype=float).reshape(3)
+        vector.setflags(write=False)
+
+        return vector
+
+    @property
+    def points(self):
+        """The points of the object, in its own space"""
+
+        return self._points
+
+    @points.setter
+    def points(self, points):
+        self._points = points
+        self.markDirty()
+
+    @property
+    def faces(self):
+        """The faces of the object (the indices of the points that make up the face)"""
+
+        return self._faces
+
+    @faces.setter
+    def faces(self, faces):
+        self._faces = faces
+        self._edges = None
+        self.markDirty()
+
+    @property
+    def position(self):
+        """The position of the object's origin in the world"""
+
+        return self._position
+
+    @position.setter
+    def position(self, position):
+        self._position = self.freezeVector(position)
+        self.markDirty()
+
+    @property
+    def rotation(self):
+        """The Euler angles of the object around the x, y and z axes, in radians"""
+
+        return self._rotation
+
+    @rotation.setter
+    def rotation(self, rotation):
+        self._rotation = self.freezeVector(rotation)
+        self.markDirty()
+
+    @property
+    def scale(self):
+        """The scale of the object along each axis"""
+
+        return self._scale
+
+    @scale.setter
+    def scale(self, scale):
+        self._scale = self.freezeVector(np.broadcast_to(scale, 3))
+        self.markDirty()
+
+    def markDirty(self):
+        """Drops the cached world-space points and bounding volumes and increments the version, after the transform
+        changed or the points were modified in place. The edges only depend on the faces and are kept."""
+
+        self.version += 1
+        self.dirty = True
+        self._model_matrix = None
+        self._aabb = None
+        self._bounding_sphere = None
+        self._vertex_colors = None
+
+    @property
+    def model_matrix(self):
+        """The 4x4 matrix mapping the object's points to world space, as column vectors"""
+
+        if self._model_matrix is None:
+            model_matrix = np.eye(4)
+            model_matrix[:3, :3] = rotationMatrix(self._rotation) * self._scale
+            model_matrix[:3, 3] = self._position
+            self._model_matrix = model_matrix
+
+        return self._model_matrix
+
+    def worldPoints(self):
+        """Returns the points in world space, transformed again only when the object is dirty. An object that was never
+        moved returns its own points.
+
+        Returns
+        -------
+        np.array
+            An (N, 3) array of points
+        """
+
+        if self.dirty:
+            points = np.asarray(self.points, dtype=float).reshape(-1, 3)
+            model_matrix = self.model_matrix
+            if not np.array_equal(model_matrix, np.eye(4)):
+                points = points @ model_matrix[:3, :3].T + model_matrix[:3, 3]
+
+            self._world_points = points
+            self.dirty = False
+
+        return self._world_points
+
+    def vertexColors(self, colorize):
+        """Returns the colors of the world-space points, computed again only when the object is dirty
+
+        Parameters
+        ----------
+        colorize : function
+            Maps an (N, 3) array of points to an (N, 3) array of colors
+
+        Returns
+        -------
+        np.array
+            An (N, 3) array of colors
+        """
+
+        if self._vertex_colors is None:
+            self._vertex_colors = colorize(self.worldPoints())
+
+        return self._vertex_colors
+
+    @property
+    def edges(self):
+        """The (E, 2) 0-based point indices of the edges of the faces, an edge shared by several faces listed once, in
+        the direction of the first face using it"""
+
+        if self._edges is None:
+            faces = np.asarray(self.faces, dtype=np.intp).reshape(-1, 3) - 1
+            edges = np.stack([faces, np.roll(faces, -1, axis=1)], axis=2).reshape(-1, 2)
+
+            _, first = np.unique(np.sort(edges, axis=1), axis=0, return_index=True)
+            self._edges = edges[np.sort(first)]
+
+        return self._edges
+
+    @property
+    def aabb(self):
+        """The (2, 3) lower and upper corners of the axis-aligned box around the world-space points"""
+
+        if self._aabb is None:
+            self._aabb, self._bounding_sphere = pointBounds(self.worldPoints())
+
+        return self._aabb
+
+    @property
+    def bounding_sphere(self):
+        """The center and radius of a sphere around the world-space points, centered on the box around them"""
+
+        if self._bounding_sphere is None:
+            self._aabb, self._bounding_sphere = pointBounds(self.worldPoints())
+
+        return self._bounding_sphere
+
+
+class InstancedGameObject(GameObject):
+    """Many copies of one mesh: the points and faces are shared, and each instance only adds a model matrix. The
+    transforms are stored as a single (K, 4, 4) array, mapping the mesh's points to world space as column vectors. The
+    object's own position, rotation and scale move all the instances together.
+
+    Parameters
+    ----------
+    points : np.array
+        The (N, 3) points of the shared mesh
+    faces : np.array
+        The faces of the shared mesh (the 1-based indices of the points that make up the face)
+    transforms : np.array
+        A (K, 4, 4) array of model matrices, one per instance
     """
 
-    def __init__(self, points, faces):
-        self.points = points
-        self.faces = faces
+    def __init__(self, points, faces, transforms, position=(0, 0, 0), rotation=(0, 0, 0), scale=1):
+        self._instance_matrices = None
+        super().__init__(points, faces, position, rotation, scale)
+
+        self.transforms = np.asarray(transforms, dtype=float).reshape(-1, 4, 4)
+
+        # Bounding volumes of the shared mesh, in its own space
+        self.mesh_aabb, self.mesh_sphere = pointBounds(points)
+
+    @GameObject.points.setter
+    def points(self, points):
+        self._points = points
+        self.mesh_aabb, self.mesh_sphere = pointBounds(points)
+        self.markDirty()
+
+    def setTransforms(self, transforms):
+        """Replaces the model matrices of the instances
+
+        Parameters
+        ----------
+        transforms : np.array
+            A (K, 4, 4) array of model matrices
+        """
+
+        self.transforms = np.asarray(transforms, dtype=float).reshape(-1, 4, 4)
+        self.markDirty()
+
+    def markDirty(self):
+        self._instance_matrices = None
+        super().markDirty()
+
+    @property
+    def instance_matrices(self):
+        """The (K, 4, 4) model matrices of the instances combined with the object's own"""
+
+        if self._instance_matrices is None:
+            self._instance_matrices = self.model_matrix @ self.transforms
+
+        return self._instance_matrices
+
+    def instanceSpheres(self):
+        """Returns the bounding spheres of the instances: the mesh's sphere, moved by each model matrix and grown by its
+        largest axis scale
+
+        Returns
+        -------
+        centers : np.array
+            A (K, 3) array of centers
+        radii : np.array
+            A (K,) array of radii
+        """
+
+        center, radius = self.mesh_sphere
+        linear = self.instance_matrices[:, :3, :3]
+
+        centers = linear @ center + self.instance_matrices[:, :3, 3]
+        radii = radius * np.sqrt((linear ** 2).sum(axis=1).max(axis=1))
+
+        return centers, radii
+
+    def worldPoints(self, instances=None):
+        """Returns the points of the instances in world space
+
+        Parameters
+        ----------
+        instances : np.array
+            The indices of the instances, all of them by default
+
+        Returns
+        -------
+        np.array
+            A (K, N, 3) array of points
+        """
+
+        transforms = self.instance_matrices if instances is None else self.instance_matrices[instances]
+        points = np.asarray(self.points, dtype=float).reshape(-1, 3)
+
+        return points @ transforms[:, :3, :3].transpose(0, 2, 1) + transforms[:, np.newaxis, :3, 3]
+
+    @property
+    def aabb(self):
+        """The (2, 3) lower and upper corners of the axis-aligned box around every instance"""
+
+        if self._aabb is None:
+            # The corners of the mesh's box, moved by every model matrix
+            low, high = self.mesh_aabb
+            corners = np.stack(np.meshgrid(*zip(low, high), indexing="ij"), axis=-1).reshape(-1, 3)
+            transforms = self.instance_matrices
+            world_corners = (corners @ transforms[:, :3, :3].transpose(0, 2, 1)
+                             + transforms[:, np.newaxis, :3, 3]).reshape(-1, 3)
+
+            self._aabb = np.array([world_corners.min(axis=0), world_corners.max(axis=0)]) if len(world_corners) \
+                else np.zeros((2, 3))
+
+        return self._aabb
+
+    @property
+    def bounding_sphere(self):
+        """The center and radius of a sphere around every instance, centered on the box around them"""
+
+        if self._bounding_sphere is None:
+            center = self.aabb.mean(axis=0)
+            centers, radii = self.instanceSpheres()
+            radius = (np.sqrt(((centers - center) ** 2).sum(axis=1)) + radii).max() if len(radii) else 0.0
+            self._bounding_sphere = (center, radius)
+
+        return self._bounding_sphere
+
+
+class ParticleStore:
+    """Structure-of-arrays storage of the particles of a fluid, along with preallocated scratch buffers reused by every
+    update
+
+    Parameters
+    ----------
+    positions : np.array
+        An (N, 3) array of positions
+    velocities : np.array
+        An (N, 3) array of velocities
+    masses : np.array
+        An (N,) array of masses
+    dtype : np.dtype
+        The float type of the particle arrays (float64 or float32)
+    """
+
+    def __init__(self, positions, velocities, masses, dtype=np.float64):
+        self.dtype = np.dtype(dtype)
+
+        self.positions = np.ascontiguousarray(positions, dtype=self.dtype).reshape(-1, 3)
+        self.velocities = np.ascontiguousarray(velocities, dtype=self.dtype).reshape(-1, 3)
+        self.masses = np.ascontiguousarray(masses, dtype=self.dtype)
+
+        self.scratch_buffers = {}
+
+    @classmethod
+    def fromParticles(cls, particles, dtype=np.float64):
+        """Builds a store from a list of Particle objects
+
+        Parameters
+        ----------
+        particles : list
+            A list of particles
+        dtype : np.dtype
+            The float type of the particle arrays
+
+        Returns
+        -------
+        store : simulation.ParticleStore
+            The store
+        """
+
+        return cls([particle.position for particle in particles],
+                   [particle.velocity for particle in particles],
+                   [particle.mass for particle in particles],
+                   dtype)
+
+    def scratch(self, name, shape, dtype=None):
+        """Returns the scratch buffer of the given name, only allocating it when it doesn't exist yet or its shape changed.
+        Its content is left over from the previous use.
+
+        Parameters
+        ----------
+        name : str
+            The name of the buffer
+        shape : tuple
+            The shape of the buffer
+        dtype : np.dtype
+            The type of the buffer, the store's float type by default
+
+        Returns
+        -------
+        buffer : np.array
+            The buffer
+        """
+
+        dtype = self.dtype if dtype is None else dtype
+        buffer = self.scratch_buffers.get(name)
+        if buffer is None or buffer.shape != shape or buffer.dtype != dtype:
+            buffer = np.empty(shape, dtype=dtype)
+            self.scratch_buffers[name] = buffer
+
+        return buffer
 
 
 class Fluid:
@@ -37,97 +626,735 @@ class Fluid:
 
     Parameters
     ----------
-    particles : list
-        A list of particles
+    particles : ParticleStore or list
+        The particle store, or a list of particles
     position : np.array
         An array of the position of the origin of the fluid.
     size : np.array
         An array containing size in the x, y, and z directions
+    neighbor_mode : str
+        How particle pairs are found ("all_pairs" for the reference N*N kernel, "grid" for a uniform cell list,
+        "tiled" for a memory-bounded all-pairs kernel, "verlet" for a cell list reused across steps)
+    cutoff : float
+        The interaction range used by the cell and Verlet lists. Pairs further apart than this are ignored
+    tile_size : int
+        The number of rows evaluated at once by the tiled kernel
+    skin : float
+        The margin added to the cutoff when building the Verlet list
+    sleep_steps : int
+        The number of consecutive calm steps after which a particle falls asleep. 0 disables sleeping
+    sleep_velocity : float
+        The speed under which a particle is calm, measured from the distance it actually moved over a step
+    gravity : float
+        The velocity lost downwards every full-frame step
+    damping : float
+        The factor the velocities are multiplied by every full-frame step
     """
 
-    def __init__(self, particles, position, size, bounds_object):
+    def __init__(self, particles, position, size, bounds_object, neighbor_mode="all_pairs", cutoff=1.0, tile_size=256,
+                 skin=0.3, sleep_steps=0, sleep_velocity=0.05, gravity=0.1, damping=0.99):
 
-        self.p_positions = np.array([particle.position for particle in particles])
-        self.p_velocities = np.array([particle.velocity for particle in particles])
-        self.p_masses = np.array([particle.mass for particle in particles])
+        if not isinstance(particles, ParticleStore):
+            particles = ParticleStore.fromParticles(particles)
+        self.particles = particles
 
         self.bounds_object = bounds_object
         self.position = np.array(position)
         self.size = np.array(size)
+        # The size in the particles' float type, compared against every step
+        self.bounds = self.size.astype(particles.dtype)
+        self.gravity = gravity
+        self.damping = damping
+
+        self.neighbor_mode = neighbor_mode
+        self.cutoff = cutoff
+        self.tile_size = tile_size
+        self.skin = skin
+
+        # Verlet list in CSR form: the neighbors of particle i are verlet_indices[verlet_indptr[i]:verlet_indptr[i + 1]]
+        self.verlet_indptr = None
+        self.verlet_indices = None
+        self.verlet_rows = None
+        self.verlet_positions = None
+        self.verlet_stats = {"builds": 0, "steps": 0}
+
+        # Sleeping particles are neither integrated nor sources of forces until an awake particle comes near them
+        self.sleep_steps = sleep_steps
+        self.sleep_velocity = sleep_velocity
+        self.p_awake = np.ones(len(self.p_positions), dtype=bool)
+        self.p_calm_steps = np.zeros(len(self.p_positions), dtype=np.int32)
+
+        # Reused by the tiled kernel instead of allocating an acceleration array every step
+        self.p_accelerations = np.zeros_like(self.p_positions)
+
+        # Set by parallel.FluidWorkerPool.attach when the interactions are computed by worker processes
+        self.worker_pool = None
+
+        # A backends.Backend running the whole step kernel instead of the neighbor modes, if set
+        self.backend = None
+
+    @property
+    def p_positions(self):
+        return self.particles.positions
 
-    def update(self, dt):
-        """Updates the fluid by calculating each particle's acceleration and moving the particles according to their velocity
+    @p_positions.setter
+    def p_positions(self, value):
+        self.particles.positions = value
+
+    @property
+    def p_velocities(self):
+        return self.particles.velocities
+
+    @p_velocities.setter
+    def p_velocities(self, value):
+        self.particles.velocities = value
+
+    @property
+    def p_masses(self):
+        return self.particles.masses
+
+    @p_masses.setter
+    def p_masses(self, value):
+        self.particles.masses = value
+
+    def update(self, dt, step_fraction=1.0):
+        """Updates the fluid by calculating each particle's acceleration and moving the particles according to their velocity.
+        Apart from the interaction kernels, every operation works in place on the particle store's scratch buffers.
+
+        Parameters
+        ----------
+        dt : float
+            The time step
+        step_fraction : float
+            The fraction of the frame covered by the step. The velocity changes are scaled by it and the damping raised to
+            it, so that the dynamics of a frame don't depend on the number of steps it is split into
+        """
+
+        if self.backend is not None:
+            self.backend.step(self, dt, step_fraction)
+            return
+
+        if self.sleep_steps > 0:
+            self.updateAwake(dt, step_fraction)
+            return
+
+        self.applyParticleInteractions(step_fraction)
+        self.integrate(self.p_positions, self.p_velocities, dt, step_fraction)
+
+    def integrate(self, positions, velocities, dt, step_fraction=1.0):
+        """Applies the external forces (gravity, the fountain and the walls) and moves the given particles, in place
 
         Parameters
         ----------
+        positions : np.array
+            An (N, 3) array of positions
+        velocities : np.array
+            An (N, 3) array of velocities
         dt : float
             The time step
+        step_fraction : float
+            The fraction of the frame covered by the step, scaling gravity, the fountain and the damping
         """
 
-        self.applyParticleInteractions()
+        nb_particles = len(positions)
 
         # Gravity
-        self.p_velocities -= np.array([0, 0.1, 0])
+        velocities[:, 1] -= self.gravity * step_fraction
 
         # Simulating a fountain
-        # find the particles that are in the center of the fluid (a cylinder in the middle of the fluid)
+        center_particles = self.fountainMask(positions)
+        np.add(velocities[:, 1], 0.2 * step_fraction, out=velocities[:, 1], where=center_particles)
+
+        pos_test = self.particles.scratch("pos_test", (nb_particles, 3))
+        np.multiply(velocities, dt, out=pos_test)
+        pos_test += positions
+
+        # Collision with the walls
+        bounds_collision = self.particles.scratch("bounds_collision", (nb_particles, 3), bool)
+        upper_bounds_collision = self.particles.scratch("upper_bounds_collision", (nb_particles, 3), bool)
+        np.less_equal(pos_test, 0, out=bounds_collision)
+        np.greater_equal(pos_test, self.bounds, out=upper_bounds_collision)
+        bounds_collision |= upper_bounds_collision
+
+        np.multiply(velocities, -1 * (0.5), out=velocities, where=bounds_collision)
+
+        np.clip(pos_test, 0, self.bounds, out=pos_test)
+
+        # Global damping
+        velocities *= self.damping ** step_fraction
+
+        # Written in place as the arrays may live in shared memory
+        np.copyto(positions, pos_test)
+
+    def fountainMask(self, positions):
+        """Finds the particles that are in the center of the fluid (a cylinder in the middle of the fluid), where the
+        fountain pushes them up
+
+        Parameters
+        ----------
+        positions : np.array
+            An (N, 3) array of positions
+
+        Returns
+        -------
+        center_particles : np.array
+            An (N,) boolean scratch array, only valid until the next call
+        """
+
+        nb_particles = len(positions)
+
         # Calculate the center of the fluid
         center = self.size / 2
-        # Calculate the distances of the particles from the center, ignoring the height
-        distances = np.linalg.norm(self.p_positions[:, [0, 2]] - center[[0, 2]], axis=1)
+        # Calculate the squared distances of the particles from the center, ignoring the height
+        distances = self.particles.scratch("fountain_distances", (nb_particles,))
+        offsets = self.particles.scratch("fountain_offsets", (nb_particles,))
+        np.subtract(positions[:, 0], center[0], out=distances)
+        np.square(distances, out=distances)
+        np.subtract(positions[:, 2], center[2], out=offsets)
+        np.square(offsets, out=offsets)
+        distances += offsets
         # Define the radius of the cylinder
         radius = min(self.size[[0, 2]]) / 5
         # Find the particles that are in the center of the fluid
-        center_particles = np.where(distances < radius)
-        self.p_velocities[center_particles] += np.array([0, 0.2, 0])
+        center_particles = self.particles.scratch("fountain_mask", (nb_particles,), bool)
+        np.less(distances, radius * radius, out=center_particles)
 
+        return center_particles
 
+    def updateAwake(self, dt, step_fraction=1.0):
+        """Updates the fluid, only moving the awake particles. Particles that stay calm for sleep_steps steps fall asleep,
+        sleeping particles within the cutoff of a moving one wake up. The sleeping particles in the cells around the
+        awake ones still push them, so that a particle resting on a settled region stays at rest. Interactions are found
+        with a cell list, so the cost of a step follows the number of awake particles.
 
+        Parameters
+        ----------
+        dt : float
+            The time step
+        step_fraction : float
+            The fraction of the frame covered by the step, scaling the velocity changes and the damping
+        """
 
-        pos_test = self.p_positions + self.p_velocities * dt
+        if len(self.p_awake) != len(self.p_positions):
+            self.p_awake = np.ones(len(self.p_positions), dtype=bool)
+            self.p_calm_steps = np.zeros(len(self.p_positions), dtype=np.int32)
 
-        # Collision with the walls
-        lower_bounds_collision = pos_test <= 0
-        upper_bounds_collision = pos_test >= self.size
+        awake = np.flatnonzero(self.p_awake)
+        if len(awake) == 0:
+            return
 
-        self.p_velocities[lower_bounds_collision] *= -1 * (0.5)
-        self.p_velocities[upper_bounds_collision] *= -1 * (0.5)
+        # The sleeping particles around the awake ones are sources of forces, but are not moved
+        sources = np.concatenate((awake, self.sleepersNear(awake)))
+        source_positions = self.p_positions[sources]
 
-        pos_test = np.clip(pos_test, 0, self.size)
+        pairs_i, pairs_j = buildCellPairs(source_positions, self.cutoff)
+        accelerations = pairAccelerations(source_positions, self.p_masses[sources], pairs_i, pairs_j,
+                                          self.cutoff)[:len(awake)]
+        accelerations *= step_fraction
 
-        # Global damping
-        self.p_velocities *= 0.99
+        positions = source_positions[:len(awake)]
+        velocities = self.p_velocities[awake]
+        previous_positions = positions.copy()
+
+        velocities += accelerations
 
-        self.p_positions = pos_test
+        self.integrate(positions, velocities, dt, step_fraction)
 
-    def applyParticleInteractions(self):
-        """Calculates and applies the accelerations of all particles
+        self.p_positions[awake] = positions
+        self.p_velocities[awake] = velocities
+
+        # Count the consecutive calm steps of each awake particle. Calm is judged on the distance moved over the step
+        # rather than on the velocity: a particle resting on the floor or on the others keeps bouncing off them, its
+        # velocity flipping every step while its position barely changes
+        displacements = positions - previous_positions
+        calm = np.einsum("ij,ij->i", displacements, displacements) < (self.sleep_velocity * dt) ** 2
+        # The fountain keeps driving the particles in its column
+        calm &= ~self.fountainMask(positions)
+        self.p_calm_steps[awake] = np.where(calm, self.p_calm_steps[awake] + 1, 0)
+
+        falling_asleep = awake[self.p_calm_steps[awake] >= self.sleep_steps]
+        self.p_awake[falling_asleep] = False
+        self.p_velocities[falling_asleep] = 0
+
+        self.wakeNeighbors(sources, pairs_i, pairs_j)
+
+    def wakeNeighbors(self, particles, pairs_i, pairs_j):
+        """Wakes the sleeping particles within the cutoff of an awake particle that moved this step. Awake particles that
+        are calm as well don't wake their neighbors, so a settled region can fall asleep as a whole. The pairs found by
+        the step's cell list are reused: a pair it missed, brought within range by this step's move, is woken by the
+        next step.
 
         Parameters
         ----------
-        particle: Particle
-            The particle
-        dt : float
-            The time step
+        particles : np.array
+            The indices of the particles of the step's cell list, awake or sleeping
+        pairs_i : np.array
+            The first positions in particles of the pairs found by the cell list
+        pairs_j : np.array
+            The second positions in particles of the pairs
         """
 
-        # Calculate the vectors between the particles
+        wakers = self.p_awake[particles] & (self.p_calm_steps[particles] == 0)
+        asleep = ~self.p_awake[particles]
+
+        mixed = (wakers[pairs_i] & asleep[pairs_j]) | (asleep[pairs_i] & wakers[pairs_j])
+        pairs_i = pairs_i[mixed]
+        pairs_j = pairs_j[mixed]
+        if len(pairs_i) == 0:
+            return
+
+        # Wake the sleeping particles actually within the cutoff of a waker
+        positions = self.p_positions[particles]
+        in_range = np.linalg.norm(positions[pairs_i] - positions[pairs_j], axis=1) < self.cutoff
+
+        waking = particles[np.where(asleep[pairs_i], pairs_i, pairs_j)[in_range]]
+        self.p_awake[waking] = True
+        self.p_calm_steps[waking] = 0
+
+    def sleepersNear(self, particles):
+        """Finds the sleeping particles lying in the same or an adjacent cell of a cutoff-sized grid as the given ones
+
+        Parameters
+        ----------
+        particles : np.array
+            The indices of the particles
+
+        Returns
+        -------
+        np.array
+            The indices of the sleeping particles
+        """
+
+        asleep = np.flatnonzero(~self.p_awake)
+        if len(asleep) == 0 or len(particles) == 0:
+            return np.empty(0, dtype=np.intp)
+
+        cells = np.floor(self.p_positions / self.cutoff).astype(np.int64)
+        cells -= cells.min(axis=0) - 1
+        dims = cells.max(axis=0) + 2
+        keys = (cells[:, 0] * dims[1] + cells[:, 1]) * dims[2] + cells[:, 2]
+
+        offsets = np.array([(dx, dy, dz) for dx in (-1, 0, 1) for dy in (-1, 0, 1) for dz in (-1, 0, 1)])
+        offset_keys = (offsets[:, 0] * dims[1] + offsets[:, 1]) * dims[2] + offsets[:, 2]
+
+        # Flag the reached cells in a lookup table over the grid rather than sorting their keys
+        reached_cells = np.zeros(int(np.prod(dims)), dtype=bool)
+        reached_cells[keys[particles][:, np.newaxis] + offset_keys[np.newaxis, :]] = True
+
+        return asleep[reached_cells[keys[asleep]]]
+
+    def activityStats(self):
+        """Returns how many particles are awake
+
+        Returns
+        -------
+        stats : dict
+            The number of awake particles and the fraction of the fluid they represent
+        """
+
+        nb_awake = int(np.count_nonzero(self.p_awake))
+
+        return {
+            "awake": nb_awake,
+            "awake_ratio": nb_awake / max(len(self.p_awake), 1),
+        }
+
+    def applyParticleInteractions(self, step_fraction=1.0):
+        """Calculates and applies the accelerations of all particles, using the fluid's neighbor mode
+
+        Parameters
+        ----------
+        step_fraction : float
+            The fraction of the frame covered by the step, scaling the accelerations
+        """
+
+        if self.worker_pool is not None:
+            accelerations = self.worker_pool.computeAccelerations(self)
+            accelerations *= step_fraction
+            self.p_velocities += accelerations
+        elif self.neighbor_mode == "all_pairs":
+            self.applyAllPairsInteractions(step_fraction)
+        elif self.neighbor_mode == "grid":
+            self.applyGridInteractions(step_fraction)
+        elif self.neighbor_mode == "tiled":
+            self.applyTiledInteractions(step_fraction)
+        elif self.neighbor_mode == "verlet":
+            self.applyVerletInteractions(step_fraction)
+        else:
+            raise ValueError(f"Unknown neighbor mode: {self.neighbor_mode}")
+
+    def applyGridInteractions(self, step_fraction=1.0):
+        """Calculates and applies the accelerations of all particles, only evaluating pairs found in adjacent cells of a
+        uniform grid sized to the cutoff
+
+        Parameters
+        ----------
+        step_fraction : float
+            The fraction of the frame covered by the step, scaling the accelerations
+        """
+
+        pairs_i, pairs_j = buildCellPairs(self.p_positions, self.cutoff)
+
+        accelerations = pairAccelerations(self.p_positions, self.p_masses, pairs_i, pairs_j, self.cutoff)
+        accelerations *= step_fraction
+        self.p_velocities += accelerations
+
+    def applyVerletInteractions(self, step_fraction=1.0):
+        """Calculates and applies the accelerations of all particles from the Verlet list, rebuilding it first if a particle
+        may have come within the cutoff of one that is not listed as its neighbor
+
+        Parameters
+        ----------
+        step_fraction : float
+            The fraction of the frame covered by the step, scaling the accelerations
+        """
+
+        if self.verlet_positions is None or self.verlet_positions.shape != self.p_positions.shape or self.verletListExpired():
+            self.buildVerletList()
+
+        self.verlet_stats["steps"] += 1
+
+        accelerations = pairAccelerations(self.p_positions, self.p_masses, self.verlet_rows, self.verlet_indices,
+                                          self.cutoff)
+        accelerations *= step_fraction
+        self.p_velocities += accelerations
+
+    def verletListExpired(self):
+        """Checks whether a particle moved by more than half the skin since the Verlet list was built. Below that, no two
+        particles can have closed the skin between them, so the list still holds every pair within the cutoff.
+
+        Returns
+        -------
+        bool
+            True if the list must be rebuilt
+        """
+
+        nb_particles = len(self.p_positions)
+        displacements = self.particles.scratch("verlet_displacements", (nb_particles, 3))
+        np.subtract(self.p_positions, self.verlet_positions, out=displacements)
+        np.square(displacements, out=displacements)
+
+        return displacements.sum(axis=1).max(initial=0) > (self.skin / 2) ** 2
+
+    def buildVerletList(self):
+        """Builds the Verlet list: every pair closer than cutoff + skin, found with a cell list and stored in CSR form
+        """
+
+        positions = self.p_positions
+        list_range = self.cutoff + self.skin
+
+        pairs_i, pairs_j = buildCellPairs(positions, list_range)
+        in_range = np.linalg.norm(positions[pairs_i] - positions[pairs_j], axis=1) < list_range
+        pairs_i = pairs_i[in_range]
+        pairs_j = pairs_j[in_range]
+
+        order = np.argsort(pairs_i, kind="stable")
+        self.verlet_rows = pairs_i[order]
+        self.verlet_indices = pairs_j[order]
+        self.verlet_indptr = np.zeros(len(positions) + 1, dtype=np.intp)
+        np.cumsum(np.bincount(pairs_i, minlength=len(positions)), out=self.verlet_indptr[1:])
+
+        self.verlet_positions = positions.copy()
+        self.verlet_stats["builds"] += 1
+
+    def neighborListStats(self):
+        """Returns how often the Verlet list was rebuilt, to tune the skin: a larger skin rebuilds less often but lists
+        more pairs to evaluate every step
+
+        Returns
+        -------
+        stats : dict
+            The number of builds and steps, the fraction of steps that rebuilt the list and the mean number of listed
+            neighbors per particle
+        """
+
+        builds = self.verlet_stats["builds"]
+        steps = self.verlet_stats["steps"]
+        nb_pairs = 0 if self.verlet_indices is None else len(self.verlet_indices)
 
-        vectors = self.p_positions[:, np.newaxis, :] - self.p_positions[np.newaxis, :, :]
+        return {
+            "builds": builds,
+            "steps": steps,
+            "rebuild_rate": builds / steps if steps else 0,
+            "mean_neighbors": 2 * nb_pairs / max(len(self.p_positions), 1),
+        }
+
+    def applyTiledInteractions(self, step_fraction=1.0):
+        """Calculates and applies the accelerations of all particles by evaluating every pair once, one tile of rows at a
+        time, so that memory use stays proportional to N * tile_size
+
+        Parameters
+        ----------
+        step_fraction : float
+            The fraction of the frame covered by the step, scaling the accelerations
+        """
+
+        if self.p_accelerations.shape != self.p_positions.shape:
+            self.p_accelerations = np.zeros_like(self.p_positions)
+
+        tiledAccelerations(self.p_positions, self.p_masses, self.tile_size, self.p_accelerations)
+
+        self.p_accelerations *= step_fraction
+        self.p_velocities += self.p_accelerations
+
+    def applyAllPairsInteractions(self, step_fraction=1.0):
+        """Calculates and applies the accelerations of all particles by evaluating every pair (reference mode). The N*N
+        temporaries are kept in the particle store's scratch buffers between steps.
+
+        Parameters
+        ----------
+        step_fraction : float
+            The fraction of the frame covered by the step, scaling the accelerations
+        """
+
+        positions = self.p_positions
+        nb_particles = len(positions)
+
+        if self.p_accelerations.shape != positions.shape:
+            self.p_accelerations = np.zeros_like(positions)
+
+        # Calculate the vectors between the particles
+        vectors = self.particles.scratch("pair_vectors", (nb_particles, nb_particles, 3))
+        np.subtract(positions[:, np.newaxis, :], positions[np.newaxis, :, :], out=vectors)
 
         # Calculate the distances between the particles into a single value
+        distances = self.particles.scratch("pair_distances", (nb_particles, nb_particles))
+        np.einsum("ijk,ijk->ij", vectors, vectors, out=distances)
+        np.sqrt(distances, out=distances)
+        overlapping = self.particles.scratch("pair_overlapping", (nb_particles, nb_particles), bool)
+        np.equal(distances, 0, out=overlapping)
+        np.copyto(distances, 0.0001, where=overlapping)
+
+        # Same as interactionForces, computed in place
+        multiplier = self.particles.scratch("pair_multiplier", (nb_particles, nb_particles))
+        np.multiply(distances, 10, out=multiplier)
+        multiplier -= 1.5
+        # Far apart pairs overflow in single precision, which correctly gives them no force
+        with np.errstate(over="ignore"):
+            np.exp(multiplier, out=multiplier)
+        multiplier += 3
+        np.reciprocal(multiplier, out=multiplier)
+
+        # Normalizing the vectors and dividing by the masses folded into a single multiplier
+        multiplier /= distances
+        multiplier /= self.p_masses
+
+        np.einsum("ijk,ij->ik", vectors, multiplier, out=self.p_accelerations)
+
+        self.p_accelerations *= step_fraction
+        self.p_velocities += self.p_accelerations
+
+
+def interactionForces(distances):
+    """Returns the magnitude of the repulsive force between particles at the given distances
+
+    Parameters
+    ----------
+    distances : np.array
+        The distances between the particles
+
+    Returns
+    -------
+    forces : np.array
+        The magnitude of the forces
+    """
+
+    return 1/(3+np.exp(10*distances-(1.5)))
+
+
+# Offsets of the 13 neighboring cells "after" a cell. Together with the cell itself they cover every adjacent pair once
+_HALF_SHELL = np.array([
+    (dx, dy, dz)
+    for dx in (-1, 0, 1)
+    for dy in (-1, 0, 1)
+    for dz in (-1, 0, 1)
+    if (dx, dy, dz) > (0, 0, 0)
+])
+
+
+def buildCellPairs(positions, cutoff):
+    """Bins the positions into a uniform grid of cells of size cutoff and returns every pair of particles lying in the
+    same or adjacent cells. Each pair is returned once, in no particular order.
+
+    Parameters
+    ----------
+    positions : np.array
+        An (N, 3) array of positions
+    cutoff : float
+        The size of a cell
+
+    Returns
+    -------
+    pairs_i : np.array
+        The indices of the first particle of each pair
+    pairs_j : np.array
+        The indices of the second particle of each pair
+    """
+
+    if len(positions) < 2:
+        return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp)
+
+    # Integer cell coordinates, padded by one cell on each side so neighbor offsets never wrap around
+    cells = np.floor(positions / cutoff).astype(np.int64)
+    cells -= cells.min(axis=0) - 1
+    dims = cells.max(axis=0) + 2
+
+    keys = (cells[:, 0] * dims[1] + cells[:, 1]) * dims[2] + cells[:, 2]
+    order = np.argsort(keys, kind="stable")
+    sorted_keys = keys[order]
+
+    pairs_i = []
+    pairs_j = []
+
+    # Pairs within the same cell: each particle with the ones sorted after it
+    starts = np.arange(1, len(sorted_keys) + 1)
+    ends = np.searchsorted(sorted_keys, sorted_keys, side="right")
+    _appendRanges(pairs_i, pairs_j, starts, ends)
+
+    # Pairs with the particles of the neighboring cells
+    for offset in _HALF_SHELL:
+        neighbor_keys = sorted_keys + (offset[0] * dims[1] + offset[1]) * dims[2] + offset[2]
+        starts = np.searchsorted(sorted_keys, neighbor_keys, side="left")
+        ends = np.searchsorted(sorted_keys, neighbor_keys, side="right")
+        _appendRanges(pairs_i, pairs_j, starts, ends)
+
+    pairs_i = order[np.concatenate(pairs_i)]
+    pairs_j = order[np.concatenate(pairs_j)]
+
+    return pairs_i, pairs_j
+
+
+def _appendRanges(pairs_i, pairs_j, starts, ends):
+    """Expands, for every sorted particle k, the range [starts[k], ends[k]) of sorted particles into explicit pairs"""
+
+    counts = np.maximum(ends - starts, 0)
+    total = counts.sum()
+    if total == 0:
+        return
+
+    owners = np.repeat(np.arange(len(counts)), counts)
+    # Position of each pair within its owner's range
+    range_offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+
+    pairs_i.append(owners)
+    pairs_j.append(starts[owners] + range_offsets)
+
+
+def pairAccelerations(positions, masses, pairs_i, pairs_j, cutoff=None):
+    """Calculates the accelerations resulting from the interactions of the given pairs of particles. Matches the
+    all-pairs kernel: both particles of a pair receive the force divided by the mass of the other particle.
+
+    Parameters
+    ----------
+    positions : np.array
+        An (N, 3) array of positions
+    masses : np.array
+        An (N,) array of masses
+    pairs_i : np.array
+        The indices of the first particle of each pair
+    pairs_j : np.array
+        The indices of the second particle of each pair
+    cutoff : float
+        Pairs further apart than this are ignored. None keeps every pair
+
+    Returns
+    -------
+    accelerations : np.array
+        An (N, 3) array of accelerations
+    """
+
+    vectors = positions[pairs_i] - positions[pairs_j]
+    distances = np.linalg.norm(vectors, axis=1)
+
+    if cutoff is not None:
+        in_range = distances < cutoff
+        pairs_i = pairs_i[in_range]
+        pairs_j = pairs_j[in_range]
+        vectors = vectors[in_range]
+        distances = distances[in_range]
+
+    distances[distances == 0] = 0.0001
+
+    vectors *= (interactionForces(distances) / distances)[:, np.newaxis]
+
+    accelerations = np.empty((len(positions), 3), dtype=positions.dtype)
+    weights_i = 1 / masses[pairs_j]
+    weights_j = 1 / masses[pairs_i]
+    for axis in range(3):
+        accelerations[:, axis] = (
+            np.bincount(pairs_i, weights=vectors[:, axis] * weights_i, minlength=len(positions))
+            - np.bincount(pairs_j, weights=vectors[:, axis] * weights_j, minlength=len(positions)))
+
+    return accelerations
+
+
+def tiledAccelerations(positions, masses, tile_size, out):
+    """Calculates the accelerations of all particles by evaluating each pair i < j once and scattering equal and opposite
+    contributions. Rows are processed tile_size at a time against the particles after them, bounding the temporaries to
+    tile_size * N elements. Matches the all-pairs kernel.
+
+    Parameters
+    ----------
+    positions : np.array
+        An (N, 3) array of positions
+    masses : np.array
+        An (N,) array of masses
+    tile_size : int
+        The number of rows evaluated at once
+    out : np.array
+        An (N, 3) array the accelerations are written to
+    """
+
+    out[:] = 0
+    nb_particles = len(positions)
+
+    for start in range(0, nb_particles, tile_size):
+        end = min(start + tile_size, nb_particles)
+
+        # Pairs between the rows of this tile and every particle from the start of the tile onwards
+        vectors = positions[start:end, np.newaxis, :] - positions[np.newaxis, start:, :]
         distances = np.linalg.norm(vectors, axis=2)
         distances[distances == 0] = 0.0001
 
-        interaction_forces = 1/(3+np.exp(10*distances-(1.5)))
+        # Only keep j > i, both within the diagonal tile and against the later particles
+        forces = np.triu(interactionForces(distances), k=1)
+        forces /= distances
+        vectors *= forces[:, :, np.newaxis]
 
-        vectors /= distances[:, :, np.newaxis]
+        out[start:end] += np.einsum("ijk,j->ik", vectors, 1 / masses[start:])
+        out[start:] -= np.einsum("ijk,i->jk", vectors, 1 / masses[start:end])
 
-        multiplier = interaction_forces / self.p_masses
 
-        accelerations = vectors * multiplier[:, :, np.newaxis]
+def rowAccelerations(positions, masses, start, end, tile_size, out):
+    """Calculates the accelerations of the particles in rows [start, end) against every particle, tile_size rows at a
+    time. Matches the rows of the all-pairs kernel, which lets disjoint row ranges be computed independently.
+
+    Parameters
+    ----------
+    positions : np.array
+        An (N, 3) array of positions
+    masses : np.array
+        An (N,) array of masses
+    start : int
+        The first row
+    end : int
+        The row after the last one
+    tile_size : int
+        The number of rows evaluated at once
+    out : np.array
+        An (end - start, 3) array the accelerations are written to
+    """
+
+    for tile_start in range(start, end, tile_size):
+        tile_end = min(tile_start + tile_size, end)
+
+        vectors = positions[tile_start:tile_end, np.newaxis, :] - positions[np.newaxis, :, :]
+        distances = np.linalg.norm(vectors, axis=2)
+        distances[distances == 0] = 0.0001
+
+        multiplier = interactionForces(distances) / distances / masses
 
-        self.p_velocities += np.sum(accelerations, axis=1)
+        out[tile_start - start:tile_end - start] = np.einsum("ijk,ij->ik", vectors, multiplier)
 
 
 class Particle:
@@ -149,7 +1376,8 @@ class Particle:
         self.mass = mass
 
 
-def addFluid(nb_particles, position=[0, 0, 0], size=[10, 10, 10]):
+def addFluid(nb_particles, position=[0, 0, 0], size=[10, 10, 10], neighbor_mode="all_pairs", cutoff=1.0, tile_size=256,
+             dtype=np.float64, skin=0.3, sleep_steps=0, seed=None):
     """Adds a fluid to the simulation.
 
     Parameters
@@ -160,6 +1388,20 @@ def addFluid(nb_particles, position=[0, 0, 0], size=[10, 10, 10]):
         The origin of the fluid
     size : np.array
         The size of the fluid in x, y, and z coordinates
+    neighbor_mode : str
+        How particle pairs are found ("all_pairs", "grid", "tiled" or "verlet")
+    cutoff : float
+        The interaction range used by the grid and verlet neighbor modes
+    tile_size : int
+        The number of rows evaluated at once by the tiled neighbor mode
+    dtype : np.dtype
+        The float type of the particle arrays (float64 or float32)
+    skin : float
+        The margin added to the cutoff when building the Verlet list
+    sleep_steps : int
+        The number of consecutive calm steps after which a particle falls asleep. 0 disables sleeping
+    seed : int
+        The seed of the particles' initial positions, None for a random layout
 
     Returns
     -------
@@ -167,15 +1409,12 @@ def addFluid(nb_particles, position=[0, 0, 0], size=[10, 10, 10]):
         The fluid
     """
 
-    particles = []
-    for i in range(nb_particles):
-        particle_position = np.array([
-            np.random.rand() * (size[0]),
-            np.random.rand() * (size[1]),
-            np.random.rand() * (size[2])
-        ])
-        velocity = np.zeros(3)
-        particles.append(Particle(particle_position, velocity))
+    # Particles are spread uniformly in the fluid's volume, at rest
+    rng = np.random.default_rng(seed)
+    particles = ParticleStore(rng.random((nb_particles, 3)) * np.array(size, dtype=float),
+                              np.zeros((nb_particles, 3)),
+                              np.ones(nb_particles),
+                              dtype)
 
     bounds_object = GameObject(np.array([
         [0, 0, 0],
@@ -194,18 +1433,24 @@ def addFluid(nb_particles, position=[0, 0, 0], size=[10, 10, 10]):
 
     ]))
 
-    fluid=Fluid(particles, position, size, bounds_object)
+    fluid=Fluid(particles, position, size, bounds_object, neighbor_mode, cutoff, tile_size, skin, sleep_steps)
 
     return fluid
 
 
-def addGameObject(fileName):
+def addGameObject(fileName, position=(0, 0, 0), rotation=(0, 0, 0), scale=1):
     """Adds a game object to the simulation.
 
     Parameters
     ----------
     fileName : str
         The name of the file containing the object
+    position : np.array
+        The position of the object in the world
+    rotation : np.array
+        The Euler angles of the object, in radians
+    scale : float or np.array
+        The scale of the object
 
     Returns
     -------
@@ -213,30 +1458,29 @@ def addGameObject(fileName):
         The game object
     """
 
-    objectFile=open("obj_files/" + fileName, "r")
+    points, faces = meshLoader.loadMesh("obj_files/" + fileName)
+
+    object=GameObject(points, faces, position, rotation, scale)
+
+    return object
 
-    lines=objectFile.readlines()
-    pointLines=list(filter(lambda x: x[0] == "v" and x[1] == " ", lines))
-    for i in range(len(pointLines)):
-        pointLines[i]=pointLines[i][2:-2].split(" ")
-        for j in range(len(pointLines[i])):
-            pointLines[i][j]=float(pointLines[i][j])
-    points=np.array(pointLines)
 
-    faceLines=list(filter(lambda x: x[0] == "f" and x[1] == " ", lines))
-    for i in range(len(faceLines)):
-        faceLines[i]=faceLines[i][2:-2].split(" ")
-        facePoints=[
-            int(faceLines[i][0].split("/")[0]),
-            int(faceLines[i][1].split("/")[0]),
-            int(faceLines[i][2].split("/")[0]),
-        ]
-        faceLines[i]=facePoints
+def addInstancedGameObject(fileName, transforms):
+    """Adds many copies of a game object to the simulation, sharing the loaded mesh.
 
-    faces=np.array(faceLines)
+    Parameters
+    ----------
+    fileName : str
+        The name of the file containing the object
+    transforms : np.array
+        A (K, 4, 4) array of model matrices, one per copy
 
-    object=GameObject(points, faces)
+    Returns
+    -------
+    object : simulation.InstancedGameObject
+        The instanced game object
+    """
 
-    objectFile.close()
+    points, faces = meshLoader.loadMesh("obj_files/" + fileName)
 
-    return object
+    return InstancedGameObject(points, faces, transforms)
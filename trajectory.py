@@ -0,0 +1,168 @@
+import struct
+
+import numpy as np
+
+# ----------------------------------------
+# Memory-mapped trajectory files
+# ----------------------------------------
+
+# Header: magic, version, frame count, particle count, flags, dtype, dt per frame, bounds size
+HEADER_FORMAT = "<8sIIIIB7xd3d"
+HEADER_SIZE = 64
+MAGIC = b"3DETRAJ\0"
+VERSION = 1
+
+FLAG_VELOCITIES = 1
+
+DTYPES = {
+    0: np.dtype("<f4"),
+    1: np.dtype("<f8"),
+}
+
+
+class TrajectoryWriter:
+    """Records particle positions (and optionally velocities) frame by frame into a preallocated, memory-mapped binary
+    file. The frame count in the header is kept up to date, so a partially written file can still be replayed.
+
+    Parameters
+    ----------
+    path : str
+        The path of the file
+    max_frames : int
+        The number of frames the file is preallocated for
+    nb_particles : int
+        The number of particles per frame
+    dt : float
+        The time step between two frames
+    size : np.array
+        The size of the bounding box of the particles, drawn on replay
+    dtype : np.dtype
+        The float type of the recorded arrays (float32 or float64)
+    velocities : bool
+        Whether the velocities are recorded along with the positions
+    """
+
+    def __init__(self, path, max_frames, nb_particles, dt, size, dtype=np.float32, velocities=False):
+        self.path = path
+        self.max_frames = max_frames
+        self.nb_particles = nb_particles
+        self.dt = dt
+        self.size = size
+        self.dtype = np.dtype(dtype).newbyteorder("<")
+        self.flags = FLAG_VELOCITIES if velocities else 0
+        self.frame_count = 0
+
+        self.dtype_code = next(code for code, dtype in DTYPES.items() if dtype == self.dtype)
+        arrays_per_frame = 2 if velocities else 1
+
+        with open(path, "wb") as f:
+            f.write(self.packHeader())
+
+        self.frames = np.memmap(path, dtype=self.dtype, mode="r+", offset=HEADER_SIZE,
+                                shape=(max_frames, arrays_per_frame, nb_particles, 3))
+        self.header = np.memmap(path, dtype=np.uint8, mode="r+", shape=(HEADER_SIZE,))
+
+    def packHeader(self):
+        """Returns the header of the file for the current frame count"""
+
+        return struct.pack(HEADER_FORMAT, MAGIC, VERSION, self.frame_count, self.nb_particles, self.flags,
+                           self.dtype_code, self.dt, *self.size)
+
+    def write(self, positions, velocities=None):
+        """Appends a frame
+
+        Parameters
+        ----------
+        positions : np.array
+            An (N, 3) array of positions
+        velocities : np.array
+            An (N, 3) array of velocities, required if the writer records them
+        """
+
+        if self.frame_count >= self.max_frames:
+            raise IndexError(f"Trajectory is full ({self.max_frames} frames)")
+
+        self.frames[self.frame_count, 0] = positions
+        if self.flags & FLAG_VELOCITIES:
+            self.frames[self.frame_count, 1] = velocities
+
+        self.frame_count += 1
+        self.header[:] = np.frombuffer(self.packHeader(), dtype=np.uint8)
+
+    def close(self):
+        """Flushes the file and truncates it to the frames actually written"""
+
+        self.frames.flush()
+        self.header.flush()
+        frame_bytes = self.frames[0].nbytes if self.max_frames else 0
+        del self.frames
+        del self.header
+
+        with open(self.path, "r+b") as f:
+            f.truncate(HEADER_SIZE + self.frame_count * frame_bytes)
+
+
+class TrajectoryReader:
+    """Streams frames from a trajectory file. The file is memory-mapped, only the frames that are read are loaded.
+
+    Parameters
+    ----------
+    path : str
+        The path of the file
+    """
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            header = struct.unpack(HEADER_FORMAT, f.read(struct.calcsize(HEADER_FORMAT)))
+
+        magic, version, self.frame_count, self.nb_particles, self.flags, dtype_code, self.dt = header[:7]
+        self.size = np.array(header[7:10])
+
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a trajectory file")
+        if self.frame_count == 0:
+            raise ValueError(f"{path} holds no frames, its recording may have been interrupted")
+
+        self.dtype = DTYPES[dtype_code]
+        arrays_per_frame = 2 if self.flags & FLAG_VELOCITIES else 1
+
+        self.frames = np.memmap(path, dtype=self.dtype, mode="r", offset=HEADER_SIZE,
+                                shape=(self.frame_count, arrays_per_frame, self.nb_particles, 3))
+
+    def __len__(self):
+        return self.frame_count
+
+    def positions(self, frame):
+        """Returns the positions of a frame, as a read-only view into the file
+
+        Parameters
+        ----------
+        frame : int
+            The index of the frame
+
+        Returns
+        -------
+        positions : np.array
+            An (N, 3) array of positions
+        """
+
+        return self.frames[frame, 0]
+
+    def velocities(self, frame):
+        """Returns the velocities of a frame, as a read-only view into the file
+
+        Parameters
+        ----------
+        frame : int
+            The index of the frame
+
+        Returns
+        -------
+        velocities : np.array
+            An (N, 3) array of velocities
+        """
+
+        if not self.flags & FLAG_VELOCITIES:
+            raise ValueError("The trajectory has no velocities")
+
+        return self.frames[frame, 1]